@@ -0,0 +1,114 @@
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+from src.alert_index import AlertRow, ThresholdSnapshot  # noqa: E402
+from src.config import ALERT_REARM_HYSTERESIS  # noqa: E402
+from src.constants import AlertKind  # noqa: E402
+
+COINS = 10_000
+SUBSCRIPTIONS = 100_000
+CYCLES = 20
+
+
+def loop_evaluate(rows: list[list], prices: dict[int, float]):
+    # Per subscriber comparison, as the update cycle did before the snapshot
+    factor = 1 + ALERT_REARM_HYSTERESIS
+    fired, rearmed = [], []
+    for row in rows:
+        coin_id, tg_id, above, alert_price, armed = row
+        if (price := prices.get(coin_id)) is None:
+            continue
+        if armed and (price > alert_price if above else price < alert_price):
+            row[4] = False
+            fired.append((coin_id, tg_id))
+        elif not armed and (
+            price * factor < alert_price if above else price >= alert_price * factor
+        ):
+            row[4] = True
+            rearmed.append((coin_id, tg_id))
+    return fired, rearmed
+
+
+def measure(evaluate, price_cycles: list[dict[int, float]]):
+    # The first cycle fires every alert already below/above its level
+    results = [evaluate(price_cycles[0])]
+    timings = []
+    for prices in price_cycles[1:]:
+        start = time.perf_counter()
+        results.append(evaluate(prices))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), results
+
+
+def main():
+    rows = [
+        AlertRow(
+            random.randint(1, COINS),
+            tg_id,
+            random.choice((AlertKind.BELOW, AlertKind.ABOVE)),
+            random.uniform(0.7, 1.3),
+            None,
+            None,
+            True,
+        )
+        for tg_id in range(SUBSCRIPTIONS)
+    ]
+    # Prices drift by up to 1% per cycle, so a few hundred alerts fire or
+    # re-arm every cycle after the first one
+    prices = {coin_id: 1.0 for coin_id in range(1, COINS + 1)}
+    price_cycles = []
+    for _ in range(CYCLES + 1):
+        prices = {k: v * random.uniform(0.99, 1.01) for k, v in prices.items()}
+        price_cycles.append(prices)
+
+    loop_rows = [
+        [row.coin_id, row.tg_id, row.kind == AlertKind.ABOVE, row.alert_price, True]
+        for row in rows
+    ]
+    loop, loop_results = measure(
+        lambda prices: loop_evaluate(loop_rows, prices), price_cycles
+    )
+
+    snapshot = ThresholdSnapshot()
+    start = time.perf_counter()
+    snapshot.load(rows)
+    load = time.perf_counter() - start
+    vectorized, snapshot_results = measure(snapshot.evaluate, price_cycles)
+
+    fired_per_cycle = []
+    for (fired, rearmed), (snapshot_fired, snapshot_rearmed) in zip(
+        loop_results, snapshot_results
+    ):
+        fired_per_cycle.append(len(fired) + len(rearmed))
+        assert set(fired) == {(c, t) for c, t, _, _ in snapshot_fired}
+        assert set(rearmed) == {(c, t) for c, t, _, _ in snapshot_rearmed}
+
+    batch = dict(random.sample(list(price_cycles[0].items()), 300))
+    small, _ = measure(snapshot.evaluate, [batch] * (CYCLES + 1))
+
+    start = time.perf_counter()
+    for row in rows[:1000]:
+        snapshot.remove(row.coin_id, row.tg_id)
+        snapshot.add(row)
+    churn = (time.perf_counter() - start) / 1000
+
+    print(
+        f"{SUBSCRIPTIONS} subscriptions over {COINS} coins, median of {CYCLES}, "
+        f"~{statistics.median(fired_per_cycle[1:]):.0f} fired/re-armed per cycle"
+    )
+    print(f"python loop:          {loop * 1000:.1f}ms per cycle")
+    print(f"vectorized snapshot:  {vectorized * 1000:.1f}ms per cycle")
+    print(f"speedup: {loop / vectorized:.1f}x")
+    print(f"snapshot, 300 coins:  {small * 1000:.2f}ms per batch")
+    print(f"snapshot load:        {load * 1000:.0f}ms")
+    print(f"snapshot add+remove:  {churn * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
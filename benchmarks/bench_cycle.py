@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+# Benchmarks fill the database with synthetic data, never use a real one
+if "DATABASE_URI" not in os.environ:
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URI"] = f"sqlite+aiosqlite:///{directory}/bench.db"
+elif tempfile.gettempdir() not in os.environ["DATABASE_URI"]:
+    sys.exit("DATABASE_URI must point into a temporary directory")
+os.environ["DEXSCREENER_API_URL"] = "http://127.0.0.1:8931"
+
+from aiohttp import web  # noqa: E402
+from apscheduler.schedulers.asyncio import AsyncIOScheduler  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from benchmarks.dexscreener_stub import REQUESTS, make_app  # noqa: E402
+from src.database import create_tables, engine, make_session  # noqa: E402
+from src.fetcher import PriceFetcher  # noqa: E402
+from src.models import Coin, User, UserCoin  # noqa: E402
+from src.notifier import NotificationDispatcher  # noqa: E402
+from src.service import (  # noqa: E402
+    load_alert_index,
+    update_prices_and_notify_subscribers,
+)
+from src.sources import PollingPriceSource  # noqa: E402
+
+CHAINS = ("ton", "ethereum", "solana", "bsc")
+
+
+# Stands in for aiogram's Bot, only sendMessage is used by the dispatcher
+class FakeBot:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Drive full update cycles against a local DexScreener stub"
+    )
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--coins", type=int, default=5_000)
+    parser.add_argument("--subscriptions-per-user", type=int, default=5)
+    parser.add_argument("--chains", type=int, default=1, choices=range(1, 5))
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument(
+        "--telegram-rate",
+        type=float,
+        default=10_000,
+        help="messages per second, 30 matches Telegram's limit",
+    )
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="report peak Python allocations, slows the cycle down",
+    )
+    return parser.parse_args()
+
+
+async def populate(args: argparse.Namespace):
+    await create_tables()
+    async with make_session() as session:
+        session.add_all(
+            Coin(
+                chain_id=CHAINS[i % args.chains],
+                token_address=f"pair{i}",
+                token_name=f"TOKEN{i}",
+                price=1.0,
+            )
+            for i in range(args.coins)
+        )
+        session.add_all(User(id=i + 1, tg_id=i) for i in range(args.users))
+        session.add_all(
+            UserCoin(
+                user_id=user_id,
+                coin_id=coin_id,
+                alert_price=random.uniform(0.0001, 10),
+            )
+            for user_id in range(1, args.users + 1)
+            for coin_id in random.sample(
+                range(1, args.coins + 1), args.subscriptions_per_user
+            )
+        )
+        await session.commit()
+        await load_alert_index(session)
+
+
+async def main():
+    args = parse_args()
+    await populate(args)
+
+    statements: Counter[str] = Counter()
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements[statement.lstrip().split(None, 1)[0].upper()] += 1
+
+    app = make_app(latency=args.latency, error_rate=args.error_rate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 8931).start()
+
+    print(
+        f"{args.coins} coins on {args.chains} chain(s), {args.users} users, "
+        f"{args.users * args.subscriptions_per_user} subscriptions, "
+        f"stub latency {args.latency}s, error rate {args.error_rate}"
+    )
+    bot = FakeBot(args.telegram_latency)
+    async with (
+        PriceFetcher() as fetcher,
+        NotificationDispatcher(
+            bot, rate_limit=args.telegram_rate, chat_interval=0  # type: ignore[arg-type]
+        ) as dispatcher,
+    ):
+        source = PollingPriceSource(fetcher, AsyncIOScheduler())
+        on_prices = partial(update_prices_and_notify_subscribers, dispatcher=dispatcher)
+        for cycle in range(1, args.cycles + 1):
+            # Cycles run minutes apart, so every one starts with a cold cache
+            fetcher.cache.clear()
+            requests, sent = len(app[REQUESTS]), bot.sent
+            statements.clear()
+            if args.tracemalloc:
+                tracemalloc.start()
+
+            start = time.perf_counter()
+            await source.poll(on_prices)
+            polled = time.perf_counter() - start
+            await dispatcher.join()
+            delivered = time.perf_counter() - start
+
+            peak = ""
+            if args.tracemalloc:
+                peak = f", peak {tracemalloc.get_traced_memory()[1] / 2**20:.1f}MiB"
+                tracemalloc.stop()
+            print(
+                f"cycle {cycle}: {polled:.2f}s, {delivered:.2f}s with delivery, "
+                f"{len(app[REQUESTS]) - requests} requests, "
+                f"{sum(statements.values())} DB statements "
+                f"({', '.join(f'{k} {v}' for k, v in statements.most_common())}), "
+                f"{bot.sent - sent} messages{peak}"
+            )
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS {maxrss / 1024:.0f}MiB")
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
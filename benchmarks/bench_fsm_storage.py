@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+# Benchmarks fill the database with synthetic data, never use a real one
+if "DATABASE_URI" not in os.environ:
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URI"] = f"sqlite+aiosqlite:///{directory}/bench.db"
+elif tempfile.gettempdir() not in os.environ["DATABASE_URI"]:
+    sys.exit("DATABASE_URI must point into a temporary directory")
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+from src.constants import DATABASE_URI  # noqa: E402
+from src.database import create_tables  # noqa: E402
+from src.storage import SQLiteStorage, encode_data  # noqa: E402
+
+DIALOGS = 100_000
+BOT_ID = 123456789
+FLUSH_EVERY = 1_000  # dialogs written between flushes, ~1s of a busy bot
+READS = 2_000
+
+
+def intent_id():
+    return "".join(random.choices(string.ascii_letters + string.digits, k=6))
+
+
+# The two records aiogram_dialog keeps per idle dialog: its stack and the
+# context of the open window
+def dialog_records(tg_id: int):
+    intent = intent_id()
+    stack = {
+        "_id": "",
+        "intents": [intent],
+        "last_message_id": random.randint(1, 10**6),
+        "last_reply_keyboard": False,
+        "last_media_id": None,
+        "last_media_unique_id": None,
+        "last_income_media_group_id": None,
+    }
+    context = {
+        "_intent_id": intent,
+        "_stack_id": "",
+        "state": "SG:SET_ALERT_PRICE",
+        "start_data": None,
+        "dialog_data": {
+            "blockchain": "ton",
+            "token_address": "EQAyrrAjgSuyHrgGO1HimNbGV9tVLndZ3uocLaOyTw_FgegD",
+            "alert_kind": "below",
+        },
+        "widget_data": {},
+        "access_settings": {"user_ids": [tg_id], "custom": None},
+    }
+    return (
+        (StorageKey(BOT_ID, tg_id, tg_id, destiny="aiogd:stack:"), stack),
+        (StorageKey(BOT_ID, tg_id, tg_id, destiny=f"aiogd:context:{intent}"), context),
+    )
+
+
+async def populate(storage: BaseStorage, records):
+    start = time.perf_counter()
+    for i, (key, data) in enumerate(records):
+        await storage.set_data(key, data)
+        if isinstance(storage, SQLiteStorage) and i % (2 * FLUSH_EVERY) == 0:
+            await storage.flush()
+    if isinstance(storage, SQLiteStorage):
+        await storage.flush()
+    return time.perf_counter() - start
+
+
+async def read_latency(storage: BaseStorage, keys: list[StorageKey]):
+    latencies = []
+    for key in random.sample(keys, READS):
+        start = time.perf_counter()
+        await storage.get_data(key)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+async def main():
+    await create_tables()
+    records = [
+        record for tg_id in range(DIALOGS) for record in dialog_records(tg_id + 1)
+    ]
+    keys = [key for key, _ in records]
+    print(
+        f"{DIALOGS} idle dialogs, {len(records)} records, "
+        f"~{statistics.mean(len(json.dumps(d)) for _, d in records[:1000]):.0f}B "
+        f"as JSON, ~{statistics.mean(len(encode_data(d)) for _, d in records[:1000]):.0f}B "
+        f"encoded"
+    )
+
+    for label, storage in (
+        ("MemoryStorage", MemoryStorage()),
+        ("SQLiteStorage", SQLiteStorage()),
+    ):
+        tracemalloc.start()
+        elapsed = await populate(storage, records)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        hot = await read_latency(storage, keys[-READS:])
+        cold = await read_latency(storage, keys[:READS])
+        print(
+            f"{label}: {current / 2**20:.1f}MiB held "
+            f"({current / DIALOGS:.0f}B per dialog), peak {peak / 2**20:.1f}MiB, "
+            f"{len(records) / elapsed:,.0f} writes/s, "
+            f"get_data p50 {hot * 1e6:.0f}us recent, {cold * 1e6:.0f}us cold"
+        )
+        await storage.close()
+
+    path = DATABASE_URI.removeprefix("sqlite+aiosqlite:///")
+    size = os.path.getsize(path)
+    print(f"database: {size / 2**20:.1f}MiB, {size / DIALOGS:.0f}B per dialog")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+from benchmarks.dexscreener_stub import make_pair  # noqa: E402
+from src.schemas import TokenStatusResponse  # noqa: E402
+
+PAIRS = (1, 30, 300)
+ROUNDS = 200
+
+
+def dict_path(body: bytes):
+    # What parse_coins_info did before: response.json() then the model tree
+    data = json.loads(body)
+    return TokenStatusResponse(pairs=data.get("pairs") or []).pairs
+
+
+def validate_json_path(body: bytes):
+    return TokenStatusResponse.model_validate_json(body).pairs
+
+
+def from_json_path(body: bytes):
+    return TokenStatusResponse.from_json(body).pairs
+
+
+def measure(decode, body: bytes):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        decode(body)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    decode(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def main():
+    for count in PAIRS:
+        body = json.dumps(
+            {
+                "schemaVersion": "1.0.0",
+                "pairs": [make_pair("ton", f"EQpair{i:040d}") for i in range(count)],
+            }
+        ).encode()
+        pairs = dict_path(body)
+        assert pairs == validate_json_path(body) == from_json_path(body)
+
+        print(f"{count} pairs, {len(body) / 1024:.0f}KiB, median of {ROUNDS}:")
+        baseline = None
+        for label, decode in (
+            ("json.loads + model", dict_path),
+            ("model_validate_json", validate_json_path),
+            ("from_json + model", from_json_path),
+        ):
+            elapsed, peak = measure(decode, body)
+            baseline = baseline or elapsed
+            print(
+                f"  {label:<22}{elapsed * 1e6:8.0f}us  {baseline / elapsed:4.1f}x  "
+                f"peak {peak / 1024:6.0f}KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
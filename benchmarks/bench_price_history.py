@@ -0,0 +1,146 @@
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+# Benchmarks fill the database with synthetic data, never use a real one
+if "DATABASE_URI" not in os.environ:
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URI"] = f"sqlite+aiosqlite:///{directory}/bench.db"
+elif tempfile.gettempdir() not in os.environ["DATABASE_URI"]:
+    sys.exit("DATABASE_URI must point into a temporary directory")
+
+from sqlalchemy import select  # noqa: E402
+
+from src.config import PRICE_HISTORY_ROLLUP_EVERY  # noqa: E402
+from src.constants import DATABASE_URI  # noqa: E402
+from src.database import create_tables, make_session  # noqa: E402
+from src.history import (  # noqa: E402
+    get_price_history,
+    record_price_ticks,
+    rollup_price_history,
+)
+from src.models import Coin  # noqa: E402
+
+COINS = 10_000
+DAYS = 30
+CYCLE = 5 * 60
+TICK_CYCLES = 288  # one day of 5 minute update cycles
+QUERIES = 200
+
+
+def populate_hourly_buckets(path: str, end: int):
+    # Older history is loaded straight into the 1h level, as if rolled up
+    start = end - DAYS * 24 * 3600
+    start -= start % 3600
+    connection = sqlite3.connect(path)
+    for coin_id in range(1, COINS + 1):
+        price = 1.0
+        rows = []
+        for ts in range(start, end - end % 3600, 3600):
+            close = price * random.uniform(0.98, 1.02)
+            rows.append(
+                (
+                    coin_id,
+                    3600,
+                    ts,
+                    price,
+                    max(price, close) * 1.01,
+                    min(price, close) * 0.99,
+                    close,
+                )
+            )
+            price = close
+        connection.executemany(
+            "INSERT INTO price_bucket VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    connection.commit()
+    rows = connection.execute("SELECT count(*) FROM price_bucket").fetchone()[0]
+    connection.close()
+    return rows
+
+
+async def main():
+    path = DATABASE_URI.removeprefix("sqlite+aiosqlite:///")
+    await create_tables()
+    async with make_session() as session:
+        session.add_all(
+            Coin(
+                chain_id="ton",
+                token_address=f"pair{i}",
+                token_name=f"TOKEN{i}",
+                price=1.0,
+            )
+            for i in range(COINS)
+        )
+        await session.commit()
+        coins = (await session.scalars(select(Coin))).all()
+
+    now = int(time.time())
+    ticks_start = now - TICK_CYCLES * CYCLE
+
+    start = time.perf_counter()
+    buckets = populate_hourly_buckets(path, ticks_start)
+    print(f"populated {buckets} hourly buckets in {time.perf_counter() - start:.1f}s")
+
+    # The first rollup also catches up the 1d level over all hourly buckets
+    start = time.perf_counter()
+    await rollup_price_history(ticks_start)
+    print(f"initial rollup_price_history: {time.perf_counter() - start:.2f}s")
+
+    prices = {coin.token_address: 1.0 for coin in coins}
+    timings = []
+    rollups = []
+    for cycle in range(TICK_CYCLES):
+        ts = ticks_start + cycle * CYCLE
+        prices = {k: v * random.uniform(0.99, 1.01) for k, v in prices.items()}
+        async with make_session() as session:
+            start = time.perf_counter()
+            await record_price_ticks(coins, prices, session, ts)
+            await session.commit()
+            timings.append(time.perf_counter() - start)
+        if ts % PRICE_HISTORY_ROLLUP_EVERY < CYCLE:
+            start = time.perf_counter()
+            await rollup_price_history(ts)
+            rollups.append(time.perf_counter() - start)
+    total = sum(timings)
+    print(
+        f"record_price_ticks x{TICK_CYCLES} cycles of {COINS} coins: "
+        f"{total:.2f}s, {TICK_CYCLES * COINS / total:,.0f} ticks/s, "
+        f"p50 cycle {statistics.median(timings) * 1000:.1f}ms"
+    )
+    print(
+        f"rollup_price_history every {PRICE_HISTORY_ROLLUP_EVERY}s x{len(rollups)}: "
+        f"p50 {statistics.median(rollups) * 1000:.0f}ms, "
+        f"max {max(rollups) * 1000:.0f}ms"
+    )
+
+    for label, since in (("1 day", 24 * 3600), (f"{DAYS} days", DAYS * 24 * 3600)):
+        latencies = []
+        rows = 0
+        async with make_session() as session:
+            for _ in range(QUERIES):
+                coin_id = random.randint(1, COINS)
+                start = time.perf_counter()
+                rows = len(
+                    await get_price_history(coin_id, now - since, now, session, now)
+                )
+                latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(
+            f"get_price_history {label}: {rows} rows, "
+            f"p50 {statistics.median(latencies) * 1000:.2f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms"
+        )
+
+    print(f"database size: {os.path.getsize(path) / 1024 / 1024:.0f}MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
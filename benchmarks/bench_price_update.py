@@ -0,0 +1,62 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+from src.database import Base, create_sqlite_engine  # noqa: E402
+from src.models import Coin  # noqa: E402
+from src.service import update_coin_price, update_coin_prices  # noqa: E402
+
+COINS = 10_000
+
+
+async def make_database(path: str):
+    engine = create_sqlite_engine(f"sqlite+aiosqlite:///{path}", "default")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    make_session = async_sessionmaker(engine, expire_on_commit=False)
+    async with make_session() as session:
+        session.add_all(
+            Coin(
+                chain_id="ton",
+                token_address=f"pair{i}",
+                token_name=f"TOKEN{i}",
+                price=1.0,
+            )
+            for i in range(COINS)
+        )
+        await session.commit()
+    return make_session
+
+
+async def main():
+    prices = {f"pair{i}": random.uniform(0.5, 1.5) for i in range(COINS)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_session = await make_database(os.path.join(directory, "per_coin.db"))
+        async with make_session() as session:
+            start = time.perf_counter()
+            for token_address, price in prices.items():
+                await update_coin_price(token_address, price, session)
+            per_coin = time.perf_counter() - start
+
+        make_session = await make_database(os.path.join(directory, "bulk.db"))
+        async with make_session() as session:
+            start = time.perf_counter()
+            missing = await update_coin_prices(prices | {"unknown": 1.0}, session)
+            bulk = time.perf_counter() - start
+
+    print(f"update_coin_price  x{COINS}: {per_coin:.3f}s")
+    print(f"update_coin_prices x{COINS}: {bulk:.3f}s (missing: {missing})")
+    print(f"speedup: {per_coin / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
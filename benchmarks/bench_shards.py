@@ -0,0 +1,137 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+# Worker processes inherit the environment, so they see the same paths
+# Benchmarks fill the database with synthetic data, never use a real one
+if "DATABASE_URI" not in os.environ:
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URI"] = f"sqlite+aiosqlite:///{directory}/bench.db"
+elif tempfile.gettempdir() not in os.environ["DATABASE_URI"]:
+    sys.exit("DATABASE_URI must point into a temporary directory")
+os.environ["DEXSCREENER_API_URL"] = "http://127.0.0.1:8931"
+
+from aiohttp import web  # noqa: E402
+from apscheduler.schedulers.asyncio import AsyncIOScheduler  # noqa: E402
+from sqlalchemy import update  # noqa: E402
+
+from benchmarks.dexscreener_stub import make_app  # noqa: E402
+from src.database import create_tables, make_session  # noqa: E402
+from src.fetcher import PriceFetcher  # noqa: E402
+from src.models import Coin, User, UserCoin  # noqa: E402
+from src.service import (  # noqa: E402
+    load_alert_index,
+    update_prices_and_notify_subscribers,
+)
+from src.sources import PollingPriceSource  # noqa: E402
+from src.utils import Shard  # noqa: E402
+
+COINS = 5_000
+USERS = 2_000
+SUBSCRIPTIONS_PER_USER = 5
+LATENCY = 0.05
+
+
+class CountingNotifier:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, chat_id: int, text: str):
+        self.sent += 1
+
+
+async def run_cycle(shard: Shard):
+    notifier = CountingNotifier()
+    async with make_session() as session:
+        await load_alert_index(session, shard)
+
+    start = time.perf_counter()
+    async with PriceFetcher() as fetcher:
+        source = PollingPriceSource(fetcher, AsyncIOScheduler(), shard)
+        await source.poll(
+            partial(update_prices_and_notify_subscribers, dispatcher=notifier)
+        )
+    return time.perf_counter() - start, notifier.sent
+
+
+def run_shard(shard: Shard):
+    return asyncio.run(run_cycle(shard))
+
+
+def warm_up():
+    time.sleep(0.5)
+
+
+async def populate():
+    await create_tables()
+    async with make_session() as session:
+        session.add_all(
+            Coin(
+                chain_id="ton",
+                token_address=f"pair{i}",
+                token_name=f"TOKEN{i}",
+                price=1.0,
+            )
+            for i in range(COINS)
+        )
+        session.add_all(User(id=i + 1, tg_id=i) for i in range(USERS))
+        session.add_all(
+            UserCoin(
+                user_id=user_id,
+                coin_id=coin_id,
+                alert_price=random.uniform(0.0001, 10),
+            )
+            for user_id in range(1, USERS + 1)
+            for coin_id in random.sample(range(1, COINS + 1), SUBSCRIPTIONS_PER_USER)
+        )
+        await session.commit()
+
+
+async def main():
+    await populate()
+
+    runner = web.AppRunner(make_app(latency=LATENCY))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 8931).start()
+
+    loop = asyncio.get_running_loop()
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    print(f"{COINS} coins, {USERS * SUBSCRIPTIONS_PER_USER} subscriptions")
+    for workers in counts:
+        async with make_session() as session:
+            await session.execute(update(UserCoin).values(alert_armed=True))
+            await session.commit()
+
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+            await asyncio.gather(
+                *(loop.run_in_executor(pool, warm_up) for _ in range(workers))
+            )
+            start = time.perf_counter()
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(pool, run_shard, Shard(i, workers))
+                    for i in range(workers)
+                )
+            )
+            elapsed = time.perf_counter() - start
+
+        slowest = max(duration for duration, _ in results)
+        sent = sum(count for _, count in results)
+        print(
+            f"{workers} worker(s): cycle {elapsed:.2f}s "
+            f"(slowest shard {slowest:.2f}s), {sent} notifications"
+        )
+
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+import os
+import random
+import statistics
+import sys
+import tempfile
+import asyncio
+import multiprocessing
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+from src.config import SQLITE_PROFILES  # noqa: E402
+from src.database import Base, create_sqlite_engine  # noqa: E402
+from src.models import Coin, User, UserCoin  # noqa: E402
+from src.service import get_user_subscriptions, update_coin_prices  # noqa: E402
+
+COINS = 10_000
+USERS = 1_000
+SUBSCRIPTIONS_PER_USER = 10
+READS = 500
+
+
+async def make_database(path: str, profile: str):
+    engine = create_sqlite_engine(f"sqlite+aiosqlite:///{path}", profile)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    make_session = async_sessionmaker(engine, expire_on_commit=False)
+    async with make_session() as session:
+        session.add_all(
+            Coin(
+                chain_id="ton",
+                token_address=f"pair{i}",
+                token_name=f"TOKEN{i}",
+                price=1.0,
+            )
+            for i in range(COINS)
+        )
+        session.add_all(User(id=i + 1, tg_id=i) for i in range(USERS))
+        session.add_all(
+            UserCoin(user_id=user_id, coin_id=coin_id, alert_price=0.5)
+            for user_id in range(1, USERS + 1)
+            for coin_id in random.sample(range(1, COINS + 1), SUBSCRIPTIONS_PER_USER)
+        )
+        await session.commit()
+    return make_session
+
+
+async def write_prices(path: str, profile: str, stop, writes):
+    engine = create_sqlite_engine(f"sqlite+aiosqlite:///{path}", profile)
+    async with async_sessionmaker(engine)() as session:
+        while not stop.is_set():
+            prices = {f"pair{i}": random.uniform(0.5, 1.5) for i in range(COINS)}
+            await update_coin_prices(prices, session)
+            writes.value += 1
+
+
+def writer(path: str, profile: str, stop, writes):
+    # A separate process, so the reader measures database locks and not the GIL
+    asyncio.run(write_prices(path, profile, stop, writes))
+
+
+async def run(profile: str, directory: str):
+    path = os.path.join(directory, f"{profile}.db")
+    make_session = await make_database(path, profile)
+    stop = multiprocessing.Event()
+    writes = multiprocessing.Value("i", 0)
+
+    process = multiprocessing.Process(target=writer, args=(path, profile, stop, writes))
+    process.start()
+    await asyncio.sleep(1)
+
+    latencies = []
+    async with make_session() as session:
+        for _ in range(READS):
+            start = time.perf_counter()
+            await get_user_subscriptions(random.randrange(USERS), session)
+            await session.rollback()  # end the read transaction so WAL can checkpoint
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    stop.set()
+    process.join()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{profile:>8}: p50 {quantiles[49]:.2f}ms  p99 {quantiles[98]:.2f}ms  "
+        f"max {max(latencies):.2f}ms  bulk updates {writes.value}"
+    )
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in SQLITE_PROFILES:
+            await run(profile, directory)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
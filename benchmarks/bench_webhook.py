@@ -0,0 +1,119 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+import aiohttp  # noqa: E402
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+
+from src.config import WEBHOOK_PATH  # noqa: E402
+from src.webhook import SECRET_HEADER, WebhookServer  # noqa: E402
+
+PORT = 8932
+SECRET = "benchmark"
+UPDATES = 5_000
+CLIENTS = 50  # concurrent deliveries, Telegram uses up to 40 by default
+CHATS = 1_000
+DUPLICATE_RATE = 0.05  # redelivered updates
+HANDLER_LATENCY = 0.005  # a DB query and a Telegram call
+RUNS = (  # workers, queue size
+    (1, 1000),
+    (8, 1000),
+    (32, 1000),
+    (32, 10),
+)
+
+
+def make_update(update_id: int):
+    chat_id = random.randint(1, CHATS)
+    return json.dumps(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 1700000000,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+                "text": "/start",
+            },
+        }
+    ).encode()
+
+
+async def deliver(session: aiohttp.ClientSession, bodies: list[bytes]):
+    latencies = []
+    while bodies:
+        body = bodies.pop()
+        start = time.perf_counter()
+        async with session.post(
+            f"http://127.0.0.1:{PORT}{WEBHOOK_PATH}",
+            data=body,
+            headers={"Content-Type": "application/json", SECRET_HEADER: SECRET},
+        ) as response:
+            assert response.status == 200, response.status
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(workers: int, queue_size: int):
+    handled = 0
+    dp = Dispatcher()
+
+    @dp.message()
+    async def handler(message: Message):
+        nonlocal handled
+        await asyncio.sleep(HANDLER_LATENCY)
+        handled += 1
+
+    bodies = [make_update(update_id) for update_id in range(UPDATES)]
+    bodies += random.sample(bodies, int(UPDATES * DUPLICATE_RATE))
+    random.shuffle(bodies)
+    deliveries = len(bodies)
+
+    bot = Bot(os.environ["BOT_TOKEN"])
+    server = WebhookServer(
+        dp,
+        bot,
+        "127.0.0.1",
+        PORT,
+        secret=SECRET,
+        workers=workers,
+        queue_size=queue_size,
+    )
+    async with server, aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(deliver(session, bodies) for _ in range(CLIENTS))
+        )
+        await server.join()
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result)
+    print(
+        f"{workers:>2} workers, queue {queue_size:>4}: "
+        f"{handled / elapsed:7,.0f} updates/s, {handled} handled of "
+        f"{deliveries} deliveries, response p50 "
+        f"{statistics.median(latencies) * 1000:.1f}ms "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms"
+    )
+    assert handled == UPDATES
+
+
+async def main():
+    print(
+        f"{UPDATES} updates + {DUPLICATE_RATE:.0%} redeliveries from {CLIENTS} "
+        f"clients, {HANDLER_LATENCY * 1000:.0f}ms handlers"
+    )
+    for workers, queue_size in RUNS:
+        await run(workers, queue_size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import asyncio
+import random
+
+from aiohttp import web
+
+# Local stand-in for DexScreener's /latest/dex/pairs/{chain}/{pairs} endpoint,
+# serving full-size pair payloads with injectable latency and error rate
+
+LATENCY = web.AppKey("latency", float)
+ERROR_RATE = web.AppKey("error_rate", float)
+REQUESTS = web.AppKey("requests", list)
+
+
+def make_pair(chain_id: str, pair_address: str):
+    price = random.uniform(0.0001, 10)
+    return {
+        "chainId": chain_id,
+        "dexId": "stonfi",
+        "url": f"https://dexscreener.com/{chain_id}/{pair_address}",
+        "pairAddress": pair_address,
+        "labels": ["v2"],
+        "baseToken": {
+            "address": f"base{pair_address}",
+            "name": f"Token {pair_address}",
+            "symbol": pair_address[:8].upper(),
+        },
+        "quoteToken": {"address": "quote", "name": "Toncoin", "symbol": "TON"},
+        "priceNative": f"{price / 3:.8f}",
+        "priceUsd": f"{price:.8f}",
+        "txns": {
+            period: {"buys": random.randint(0, 500), "sells": random.randint(0, 500)}
+            for period in ("m5", "h1", "h6", "h24")
+        },
+        "volume": {
+            period: random.uniform(0, 1e6) for period in ("m5", "h1", "h6", "h24")
+        },
+        "priceChange": {
+            period: random.uniform(-20, 20) for period in ("m5", "h1", "h6", "h24")
+        },
+        "liquidity": {"usd": random.uniform(1e3, 1e7), "base": 1e6, "quote": 1e5},
+        "fdv": random.uniform(1e5, 1e9),
+        "marketCap": random.uniform(1e5, 1e9),
+        "pairCreatedAt": 1700000000000,
+        "info": {
+            "imageUrl": f"https://dd.dexscreener.com/ds-data/tokens/{pair_address}.png",
+            "websites": [{"label": "Website", "url": "https://example.com"}],
+            "socials": [{"type": "twitter", "url": "https://x.com/example"}],
+        },
+    }
+
+
+async def pairs(request: web.Request):
+    chain_id = request.match_info["chain_id"]
+    pair_addresses = request.match_info["pair_ids"].split(",")
+    request.app[REQUESTS].append((chain_id, len(pair_addresses)))
+
+    await asyncio.sleep(request.app[LATENCY])
+    if random.random() < request.app[ERROR_RATE]:
+        raise web.HTTPServiceUnavailable()
+
+    return web.json_response(
+        {
+            "schemaVersion": "1.0.0",
+            "pairs": [make_pair(chain_id, address) for address in pair_addresses],
+        }
+    )
+
+
+def make_app(latency: float = 0.0, error_rate: float = 0.0):
+    app = web.Application()
+    app[LATENCY] = latency
+    app[ERROR_RATE] = error_rate
+    app[REQUESTS] = []
+    app.router.add_get("/latest/dex/pairs/{chain_id}/{pair_ids}", pairs)
+    return app
@@ -1,57 +1,118 @@
 import asyncio
-import logging
-import logging.config
 import os
+from contextlib import AsyncExitStack
+from functools import partial
 
 from aiogram import Bot, Dispatcher
 from aiogram.filters.command import Command
 from aiogram.types import Message
 from aiogram_dialog import DialogManager, StartMode, setup_dialogs
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy.exc import NoResultFound
 
-from src.config import BOT_TOKEN, LOGGING_CONFIG, UPDATE_EACH_MINUTES
-from src.database import Base, engine, make_session
+from src.config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    LOGGING_CONFIG,
+    METRICS_HOST,
+    METRICS_PORT,
+    PRICE_HISTORY_ROLLUP_EVERY,
+    PRICE_WORKERS,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from src.database import create_tables, make_session
 from src.dialog import SG, dialog
-from src.service import add_user, get_user, update_prices_and_notify_subscribers
-from src.utils import cast_away_optional
+from src.fetcher import PriceFetcher
+from src.history import rollup_price_history
+from src.metrics import MetricsServer
+from src.notifier import NotificationDispatcher
+from src.service import (
+    add_user,
+    get_user,
+    load_alert_index,
+    update_prices_and_notify_subscribers,
+)
+from src.sources import create_price_source
+from src.storage import create_fsm_storage
+from src.utils import cast_away_optional, configure_logging
+from src.webhook import WebhookServer, wait_for_stop_signal
+from src.workers import WorkerPool
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+dp = Dispatcher(storage=create_fsm_storage())
 scheduler = AsyncIOScheduler()
 
 
 @dp.message(Command("start"))
 async def start(message: Message, dialog_manager: DialogManager):
-    with make_session() as session:
+    async with make_session() as session:
         try:
-            get_user(cast_away_optional(message.from_user).id, session)
+            await get_user(cast_away_optional(message.from_user).id, session)
         except NoResultFound:
-            add_user(cast_away_optional(message.from_user).id, session)
+            await add_user(cast_away_optional(message.from_user).id, session)
     await dialog_manager.start(SG.HOME, mode=StartMode.RESET_STACK)
 
 
 async def main():
+    if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+        raise EnvironmentError("Webhook mode needs WEBHOOK_URL and WEBHOOK_SECRET")
+
     os.makedirs("logs", exist_ok=True)
-    logging.config.dictConfig(LOGGING_CONFIG)
+    configure_logging(LOGGING_CONFIG)
 
-    Base.metadata.create_all(engine)
+    await create_tables()
+    async with make_session() as session:
+        await load_alert_index(session)
 
     dp.include_router(dialog)
     setup_dialogs(dp)
 
-    scheduler.add_job(
-        update_prices_and_notify_subscribers,
-        CronTrigger(minute=f"*/{UPDATE_EACH_MINUTES}"),
-        args=(bot,),
-        id="update_prices_and_notify_subscribers",
-    )
+    async with AsyncExitStack() as stack:
+        if METRICS_PORT:
+            await stack.enter_async_context(MetricsServer(METRICS_HOST, METRICS_PORT))
+        fetcher = await stack.enter_async_context(PriceFetcher())
+        dispatcher = await stack.enter_async_context(NotificationDispatcher(bot))
+        dp["fetcher"] = fetcher
+
+        if PRICE_WORKERS:
+            await stack.enter_async_context(WorkerPool(dispatcher, PRICE_WORKERS))
+        else:
+            price_source = create_price_source(fetcher, scheduler)
+            await price_source.start(
+                partial(update_prices_and_notify_subscribers, dispatcher=dispatcher)
+            )
+            stack.push_async_callback(price_source.stop)
 
-    scheduler.start()
+        # Workers record price ticks too, the rollup runs once in the bot process
+        scheduler.add_job(
+            rollup_price_history,
+            "interval",
+            seconds=PRICE_HISTORY_ROLLUP_EVERY,
+            id="rollup_price_history",
+            max_instances=1,
+            coalesce=True,
+        )
+        scheduler.start()
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        match BOT_MODE:
+            case "polling":
+                await bot.delete_webhook(drop_pending_updates=True)
+                await dp.start_polling(
+                    bot, allowed_updates=dp.resolve_used_update_types()
+                )
+            case "webhook":
+                await stack.enter_async_context(WebhookServer(dp, bot))
+                await bot.set_webhook(
+                    f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=dp.resolve_used_update_types(),
+                    drop_pending_updates=True,
+                )
+                await wait_for_stop_signal()
+            case _:
+                raise ValueError(f"Unknown bot mode: {BOT_MODE}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import WSMsgType, web
+
+# Local stand-in for a push price feed, speaks the StreamingPriceSource protocol:
+#   python scripts/fake_price_stream.py --port 8765
+#   PRICE_SOURCE=stream PRICE_STREAM_URL=ws://localhost:8765/ws python bot.py
+
+INTERVAL = web.AppKey("interval", float)
+
+
+async def push_ticks(ws: web.WebSocketResponse, pairs: dict, interval: float):
+    while not ws.closed:
+        await asyncio.sleep(interval)
+        if not pairs:
+            continue
+
+        for pair in pairs.values():
+            pair["priceUsd"] = (
+                f"{float(pair['priceUsd']) * random.uniform(0.97, 1.03):.8f}"
+            )
+        await ws.send_str(json.dumps({"pairs": list(pairs.values())}))
+
+
+async def stream(request: web.Request):
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    pairs: dict[str, dict] = {}
+    pusher = asyncio.create_task(push_ticks(ws, pairs, request.app[INTERVAL]))
+    try:
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            data = json.loads(message.data)
+            if data.get("type") != "subscribe":
+                continue
+            for pair in data["pairs"]:
+                pairs.setdefault(
+                    pair["pairAddress"],
+                    {
+                        "chainId": pair["chainId"],
+                        "pairAddress": pair["pairAddress"],
+                        "priceUsd": f"{random.uniform(0.01, 10):.8f}",
+                        "baseToken": {"symbol": pair["pairAddress"][:6].upper()},
+                    },
+                )
+    finally:
+        pusher.cancel()
+    return ws
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    app = web.Application()
+    app[INTERVAL] = args.interval
+    app.router.add_get("/ws", stream)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
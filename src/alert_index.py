@@ -0,0 +1,461 @@
+import math
+from collections import defaultdict, deque
+from itertools import chain
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from src.config import ALERT_REARM_HYSTERESIS
+from src.constants import THRESHOLD_ALERT_KINDS, AlertKind
+
+
+class Trigger(NamedTuple):
+    coin_id: int
+    tg_id: int
+    kind: AlertKind
+    price: float
+    # alert price, price a window ago or the moving average that was crossed
+    level: float
+    window: int | None
+
+
+class AlertRow(NamedTuple):
+    coin_id: int
+    tg_id: int
+    kind: AlertKind
+    alert_price: float | None
+    percent: float | None
+    window: int | None
+    armed: bool
+
+
+# Samples of the last window seconds plus the latest one before it, so the
+# oldest sample is the price a window ago. Keeps a running sum for the SMA.
+class PriceWindow:
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: deque[tuple[float, float]] = deque()
+        self._sum = 0.0
+
+    def add(self, ts: float, price: float):
+        # Out of order samples (e.g. history replayed into a live window) are dropped
+        if self._samples and ts <= self._samples[-1][0]:
+            return
+        self._samples.append((ts, price))
+        self._sum += price
+        while len(self._samples) > 1 and self._samples[1][0] <= ts - self.window:
+            self._sum -= self._samples.popleft()[1]
+
+    @property
+    def full(self):
+        return (
+            len(self._samples) > 1
+            and self._samples[0][0] <= self._samples[-1][0] - self.window
+        )
+
+    @property
+    def first(self):
+        return self._samples[0][1]
+
+    @property
+    def mean(self):
+        return self._sum / len(self._samples)
+
+
+# Time-weighted EMA, so irregular polling intervals don't skew it
+class PriceEma:
+    def __init__(self, window: int):
+        self.window = window
+        self.value = 0.0
+        self._started_at: float | None = None
+        self._updated_at = 0.0
+
+    def add(self, ts: float, price: float):
+        if self._started_at is None:
+            self._started_at = self._updated_at = ts
+            self.value = price
+            return
+        if ts <= self._updated_at:
+            return
+        alpha = 1 - math.exp(-(ts - self._updated_at) / self.window)
+        self.value += alpha * (price - self.value)
+        self._updated_at = ts
+
+    @property
+    def full(self):
+        return (
+            self._started_at is not None
+            and self._updated_at - self._started_at >= self.window
+        )
+
+
+class WindowAlert:
+    def __init__(self, row: AlertRow):
+        self.tg_id = row.tg_id
+        self.kind = row.kind
+        self.percent = row.percent or 0.0
+        self.window = row.window or 0
+        self.armed = row.armed
+        # Side of the moving average the price was last seen on, 0 if unknown
+        self.side = 0
+
+
+# Columnar snapshot of below/above alerts, one slot per subscription, so a
+# whole cycle of prices is checked in a single vectorized pass. Removed slots
+# are tombstoned and compacted away once they outnumber the live ones.
+class ThresholdSnapshot:
+    COLUMNS = ("_coin", "_tg_id", "_threshold", "_above", "_armed", "_active")
+    MIN_CAPACITY = 1024
+
+    def __init__(self, hysteresis: float = ALERT_REARM_HYSTERESIS):
+        self._hysteresis = hysteresis
+        # Coin ids are dense autoincrement keys, so prices are laid out in a
+        # vector indexed by coin_id
+        self._max_coin_id = 0
+        self._slots: dict[tuple[int, int], int] = {}
+        self._coin_slots: dict[int, list[int]] = defaultdict(list)
+        self._size = 0
+        self._allocate(self.MIN_CAPACITY)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def load(self, rows: Iterable[AlertRow]):
+        self._max_coin_id = 0
+        self._slots.clear()
+        self._coin_slots.clear()
+        self._size = 0
+        rows = list(rows)
+        self._allocate(max(2 * len(rows), self.MIN_CAPACITY))
+        for row in rows:
+            self._append(row)
+
+    def add(self, row: AlertRow):
+        self.remove(row.coin_id, row.tg_id)
+        self._append(row)
+
+    def remove(self, coin_id: int, tg_id: int):
+        if (slot := self._slots.pop((coin_id, tg_id), None)) is None:
+            return
+        self._active[slot] = False
+        self._armed[slot] = False
+        self._coin_slots[coin_id].remove(slot)
+        if not self._coin_slots[coin_id]:
+            del self._coin_slots[coin_id]
+        if self._size - len(self._slots) > max(len(self._slots), self.MIN_CAPACITY):
+            self._compact()
+
+    def set_armed(self, coin_id: int, tg_id: int, armed: bool):
+        if (slot := self._slots.get((coin_id, tg_id))) is not None:
+            self._armed[slot] = armed
+
+    def evaluate(self, prices: dict[int, float]):
+        if not self._slots:
+            return [], []
+
+        # Small batches (adaptive polling, streamed ticks) only gather their
+        # coins' slots, full cycles scan every slot
+        if 8 * len(prices) < len(self._coin_slots):
+            slots = np.fromiter(
+                chain.from_iterable(self._coin_slots.get(c, ()) for c in prices),
+                dtype=np.intp,
+            )
+        else:
+            slots = np.flatnonzero(self._active[: self._size])
+
+        coin_ids = np.fromiter(prices.keys(), dtype=np.int64, count=len(prices))
+        values = np.fromiter(prices.values(), dtype=np.float64, count=len(prices))
+        known = coin_ids <= self._max_coin_id
+        price_vector = np.full(self._max_coin_id + 1, np.nan)
+        price_vector[coin_ids[known]] = values[known]
+
+        # NaN prices (coins missing from the batch) compare False everywhere
+        price = price_vector[self._coin[slots]]
+        threshold = self._threshold[slots]
+        above = self._above[slots]
+        armed = self._armed[slots]
+        factor = 1 + self._hysteresis
+        crossed = np.where(above, price > threshold, price < threshold)
+        # Only re-arm once the price is back across the hysteresis band
+        back = np.where(above, price * factor < threshold, price >= threshold * factor)
+
+        fired = slots[armed & crossed]
+        rearmed = slots[~armed & back]
+        self._armed[fired] = False
+        self._armed[rearmed] = True
+        return self._rows(fired), self._rows(rearmed)
+
+    def levels(self, coin_id: int):
+        if not (slots := self._coin_slots.get(coin_id)):
+            return []
+
+        threshold = self._threshold[slots]
+        factor = np.where(
+            self._above[slots], 1 / (1 + self._hysteresis), 1 + self._hysteresis
+        )
+        # Alert prices of armed alerts, re-arm levels of disarmed ones
+        return np.where(self._armed[slots], threshold, threshold * factor).tolist()
+
+    def _rows(self, slots: np.ndarray):
+        return [
+            (coin_id, tg_id, AlertKind.ABOVE if above else AlertKind.BELOW, threshold)
+            for coin_id, tg_id, above, threshold in zip(
+                self._coin[slots].tolist(),
+                self._tg_id[slots].tolist(),
+                self._above[slots].tolist(),
+                self._threshold[slots].tolist(),
+            )
+        ]
+
+    def _append(self, row: AlertRow):
+        if self._size == len(self._coin):
+            self._resize(2 * len(self._coin))
+        self._max_coin_id = max(self._max_coin_id, row.coin_id)
+
+        slot = self._size
+        self._size += 1
+        self._coin[slot] = row.coin_id
+        self._tg_id[slot] = row.tg_id
+        self._threshold[slot] = row.alert_price
+        self._above[slot] = row.kind == AlertKind.ABOVE
+        self._armed[slot] = row.armed
+        self._active[slot] = True
+        self._slots[(row.coin_id, row.tg_id)] = slot
+        self._coin_slots[row.coin_id].append(slot)
+
+    def _allocate(self, capacity: int):
+        self._coin = np.zeros(capacity, dtype=np.int64)
+        self._tg_id = np.zeros(capacity, dtype=np.int64)
+        self._threshold = np.zeros(capacity, dtype=np.float64)
+        self._above = np.zeros(capacity, dtype=bool)
+        self._armed = np.zeros(capacity, dtype=bool)
+        self._active = np.zeros(capacity, dtype=bool)
+
+    def _resize(self, capacity: int):
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            resized = np.zeros(capacity, dtype=column.dtype)
+            resized[: self._size] = column[: self._size]
+            setattr(self, name, resized)
+
+    def _compact(self):
+        live = np.flatnonzero(self._active[: self._size])
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[: len(live)] = column[live]
+            column[len(live) : self._size] = 0
+        remap = np.full(self._size, -1, dtype=np.intp)
+        remap[live] = np.arange(len(live))
+        self._size = len(live)
+        self._slots = {key: int(remap[slot]) for key, slot in self._slots.items()}
+        for slots in self._coin_slots.values():
+            slots[:] = remap[slots].tolist()
+
+
+# Below/above alerts live in a columnar snapshot, window based alerts share
+# one rolling window or EMA per (coin, window)
+class AlertIndex:
+    def __init__(self, hysteresis: float = ALERT_REARM_HYSTERESIS):
+        self._hysteresis = hysteresis
+        self._thresholds = ThresholdSnapshot(hysteresis)
+        self._window_alerts: dict[int, list[WindowAlert]] = defaultdict(list)
+        self._windows: dict[int, dict[int, PriceWindow]] = defaultdict(dict)
+        self._emas: dict[int, dict[int, PriceEma]] = defaultdict(dict)
+        self._cold: set[int] = set()
+
+    def load(self, rows: Iterable[AlertRow]):
+        rows = list(rows)
+        self._thresholds.load(row for row in rows if row.kind in THRESHOLD_ALERT_KINDS)
+        sides = {
+            (coin_id, alert.tg_id, alert.kind, alert.window): alert.side
+            for coin_id, alerts in self._window_alerts.items()
+            for alert in alerts
+        }
+        self._window_alerts.clear()
+
+        for row in rows:
+            if row.kind not in THRESHOLD_ALERT_KINDS:
+                alert = self._add_window_alert(row)
+                alert.side = sides.get(
+                    (row.coin_id, row.tg_id, row.kind, alert.window), 0
+                )
+        # Rolling state survives reloads, only windows nobody uses are dropped
+        self._prune_windows(set(self._windows) | set(self._emas))
+
+    def add(self, row: AlertRow):
+        self.remove(row.coin_id, row.tg_id)
+
+        if row.kind in THRESHOLD_ALERT_KINDS:
+            self._thresholds.add(row._replace(armed=True))
+        else:
+            self._add_window_alert(row._replace(armed=True))
+
+    def remove(self, coin_id: int, tg_id: int):
+        self._thresholds.remove(coin_id, tg_id)
+
+        if window_alerts := self._window_alerts.get(coin_id):
+            window_alerts[:] = [a for a in window_alerts if a.tg_id != tg_id]
+            self._prune_windows([coin_id])
+
+    def set_armed(self, alerts: Iterable[tuple[int, int]], armed: bool):
+        # Undoes an evaluation whose alert states couldn't be stored
+        for coin_id, tg_id in alerts:
+            self._thresholds.set_armed(coin_id, tg_id, armed)
+            for alert in self._window_alerts.get(coin_id, ()):
+                if alert.tg_id == tg_id and alert.kind == AlertKind.CHANGE:
+                    alert.armed = armed
+
+    def pop_cold(self):
+        # Coins whose rolling windows were just created and need history
+        cold, self._cold = self._cold, set()
+        return cold
+
+    def warm(self, coin_id: int, samples: Iterable[tuple[float, float]]):
+        for ts, price in samples:
+            if price > 0:
+                self._observe(coin_id, ts, price)
+
+    def evaluate(self, prices: dict[int, float], ts: float):
+        triggered: list[Trigger] = []
+        disarmed: list[tuple[int, int]] = []
+        rearmed: list[tuple[int, int]] = []
+
+        fired, armed = self._thresholds.evaluate(prices)
+        for coin_id, tg_id, kind, alert_price in fired:
+            triggered.append(
+                Trigger(coin_id, tg_id, kind, prices[coin_id], alert_price, None)
+            )
+            disarmed.append((coin_id, tg_id))
+        rearmed.extend((coin_id, tg_id) for coin_id, tg_id, _, _ in armed)
+
+        for coin_id, price in prices.items():
+            # Dead pairs may report 0, rolling windows only take real prices
+            if price <= 0:
+                continue
+            self._observe(coin_id, ts, price)
+            for alert in self._window_alerts.get(coin_id, ()):
+                self._evaluate_window_alert(
+                    coin_id, alert, price, triggered, disarmed, rearmed
+                )
+
+        return triggered, disarmed, rearmed
+
+    def distance(self, coin_id: int, price: float):
+        levels: list[float] = self._thresholds.levels(coin_id)
+
+        for alert in self._window_alerts.get(coin_id, ()):
+            if alert.kind == AlertKind.CHANGE:
+                window = self._windows[coin_id][alert.window]
+                if alert.armed and window.full:
+                    levels.append(window.first * (1 + alert.percent / 100))
+                    levels.append(window.first * (1 - alert.percent / 100))
+            elif (average := self._average(coin_id, alert)) is not None:
+                levels.append(average)
+
+        if not levels:
+            return None
+        if price <= 0:
+            return 0.0
+        return min(abs(level - price) / price for level in levels)
+
+    def _evaluate_window_alert(
+        self,
+        coin_id: int,
+        alert: WindowAlert,
+        price: float,
+        triggered: list[Trigger],
+        disarmed: list[tuple[int, int]],
+        rearmed: list[tuple[int, int]],
+    ):
+        if alert.kind == AlertKind.CHANGE:
+            window = self._windows[coin_id][alert.window]
+            if not window.full or window.first <= 0:
+                return
+            change = abs(price / window.first - 1) * 100
+            if alert.armed and change >= alert.percent:
+                alert.armed = False
+                triggered.append(
+                    Trigger(
+                        coin_id,
+                        alert.tg_id,
+                        alert.kind,
+                        price,
+                        window.first,
+                        alert.window,
+                    )
+                )
+                disarmed.append((coin_id, alert.tg_id))
+            elif not alert.armed and change * (1 + self._hysteresis) < alert.percent:
+                alert.armed = True
+                rearmed.append((coin_id, alert.tg_id))
+        else:
+            if (average := self._average(coin_id, alert)) is None:
+                return
+            # Crossings fire both ways, the hysteresis band ignores noise
+            if price > average * (1 + self._hysteresis):
+                side = 1
+            elif price < average / (1 + self._hysteresis):
+                side = -1
+            else:
+                return
+            if alert.side and side != alert.side:
+                triggered.append(
+                    Trigger(
+                        coin_id,
+                        alert.tg_id,
+                        alert.kind,
+                        price,
+                        average,
+                        alert.window,
+                    )
+                )
+            alert.side = side
+
+    def _add_window_alert(self, row: AlertRow):
+        window = row.window or 0
+        if row.kind == AlertKind.CROSS_EMA:
+            if window not in self._emas[row.coin_id]:
+                self._emas[row.coin_id][window] = PriceEma(window)
+                self._cold.add(row.coin_id)
+        elif window not in self._windows[row.coin_id]:
+            self._windows[row.coin_id][window] = PriceWindow(window)
+            self._cold.add(row.coin_id)
+        alert = WindowAlert(row)
+        self._window_alerts[row.coin_id].append(alert)
+        return alert
+
+    def _prune_windows(self, coin_ids: Iterable[int]):
+        for coin_id in coin_ids:
+            alerts = self._window_alerts.get(coin_id, ())
+            used = {
+                alert.window for alert in alerts if alert.kind != AlertKind.CROSS_EMA
+            }
+            used_emas = {
+                alert.window for alert in alerts if alert.kind == AlertKind.CROSS_EMA
+            }
+            windows = self._windows.get(coin_id, {})
+            emas = self._emas.get(coin_id, {})
+            for window in set(windows) - used:
+                del windows[window]
+            for window in set(emas) - used_emas:
+                del emas[window]
+            if not windows:
+                self._windows.pop(coin_id, None)
+            if not emas:
+                self._emas.pop(coin_id, None)
+
+    def _observe(self, coin_id: int, ts: float, price: float):
+        for window in self._windows.get(coin_id, {}).values():
+            window.add(ts, price)
+        for ema in self._emas.get(coin_id, {}).values():
+            ema.add(ts, price)
+
+    def _average(self, coin_id: int, alert: WindowAlert):
+        if alert.kind == AlertKind.CROSS_EMA:
+            ema = self._emas[coin_id][alert.window]
+            return ema.value if ema.full else None
+        window = self._windows[coin_id][alert.window]
+        return window.mean if window.full else None
+
+
+alert_index = AlertIndex()
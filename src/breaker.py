@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+
+import aiohttp
+
+from src.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_HALF_OPEN_PROBES,
+    BREAKER_RESET_TIMEOUT,
+    RETRY_BUDGET,
+    UPDATE_EACH_MINUTES,
+)
+from src.constants import BreakerState
+from src.metrics import BREAKER_STATE, BREAKER_TRANSITIONS, RETRIES_DENIED
+
+logger = logging.getLogger(__name__)
+
+BREAKER_STATE_VALUES = {
+    BreakerState.CLOSED: 0,
+    BreakerState.HALF_OPEN: 1,
+    BreakerState.OPEN: 2,
+}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str):
+        super().__init__(f"Circuit {name} is open")
+        self.name = name
+
+
+def is_upstream_failure(exception: BaseException):
+    # Other 4xx responses and parse errors say nothing about upstream health
+    if isinstance(exception, aiohttp.ClientResponseError):
+        return exception.status >= 500 or exception.status == 429
+    return isinstance(exception, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+# Opens after failure_threshold consecutive upstream failures and fails fast
+# until reset_timeout has passed, then lets half_open_probes calls through:
+# a successful probe closes the circuit, a failed one opens it again
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.state = BreakerState.CLOSED
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._half_open_probes = half_open_probes
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        BREAKER_STATE.set(BREAKER_STATE_VALUES[self.state], name)
+
+    def _transition(self, state: BreakerState):
+        if state == self.state:
+            return
+        level = logging.WARNING if state == BreakerState.OPEN else logging.INFO
+        logger.log(level, "Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        BREAKER_TRANSITIONS.inc(self.name, state)
+        BREAKER_STATE.set(BREAKER_STATE_VALUES[state], self.name)
+
+    def _acquire(self):
+        if self.state == BreakerState.OPEN:
+            if time.monotonic() - self._opened_at < self._reset_timeout:
+                raise CircuitOpenError(self.name)
+            self._transition(BreakerState.HALF_OPEN)
+        if self.state == BreakerState.HALF_OPEN:
+            if self._probes >= self._half_open_probes:
+                raise CircuitOpenError(self.name)
+            self._probes += 1
+            return True
+        return False
+
+    def _record_failure(self):
+        if self.state == BreakerState.OPEN:
+            return
+        self._failures += 1
+        if (
+            self.state == BreakerState.HALF_OPEN
+            or self._failures >= self._failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._transition(BreakerState.OPEN)
+
+    def _record_success(self):
+        self._failures = 0
+        self._transition(BreakerState.CLOSED)
+
+    @contextmanager
+    def guard(self):
+        probe = self._acquire()
+        try:
+            yield
+        except Exception as e:
+            if not is_upstream_failure(e):
+                raise
+            self._record_failure()
+            # Calls sleeping before a retry fail fast once the circuit opens
+            if self.state == BreakerState.OPEN:
+                raise CircuitOpenError(self.name) from e
+            raise
+        else:
+            if self.state != BreakerState.OPEN:
+                self._record_success()
+        finally:
+            if probe:
+                self._probes -= 1
+
+
+# Retries of all upstream calls share one budget per update cycle, so a
+# degraded upstream can't multiply the requests of a cycle
+class RetryBudget:
+    def __init__(self, limit: int, period: float):
+        self._limit = limit
+        self._period = period
+        self._window_start = time.monotonic()
+        self._used = 0
+        self._denied = 0
+
+    def acquire(self):
+        now = time.monotonic()
+        if now - self._window_start >= self._period:
+            self._window_start = now
+            self._used = 0
+            self._denied = 0
+        if self._used < self._limit:
+            self._used += 1
+            return True
+
+        RETRIES_DENIED.inc()
+        self._denied += 1
+        if self._denied == 1:
+            logger.warning("Retry budget of %d per cycle is spent", self._limit)
+        return False
+
+
+breakers: dict[tuple[str, str], CircuitBreaker] = {}
+retry_budget = RetryBudget(RETRY_BUDGET, UPDATE_EACH_MINUTES * 60)
+
+
+def get_breaker(endpoint: str, chain_id: str):
+    if (breaker := breakers.get((endpoint, chain_id))) is None:
+        breaker = breakers[endpoint, chain_id] = CircuitBreaker(
+            f"{endpoint}/{chain_id}"
+        )
+    return breaker
@@ -0,0 +1,141 @@
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, TypeVar
+
+from cachetools import TTLCache
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+# TTL + LRU cache where concurrent lookups of a missing key share one load
+class AsyncCache(Generic[K, V]):
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache: TTLCache[K, V] = TTLCache(maxsize, ttl)
+        self._pending: dict[K, asyncio.Future[V | None]] = {}
+        # Keys invalidated while loading, their result isn't cached
+        self._invalidated: set[K] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __setitem__(self, key: K, value: V):
+        self._store(key, value)
+
+    def clear(self):
+        # In-flight loads keep their futures, waiters still get the result
+        self._cache.clear()
+
+    def invalidate(self, key: K):
+        self._cache.pop(key, None)
+        if key in self._pending:
+            self._invalidated.add(key)
+
+    async def get(self, key: K, load: Callable[[], Awaitable[V]]) -> V:
+        while True:
+            if (value := self._cache.get(key)) is not None:
+                self.hits += 1
+                return value
+            if (pending := self._pending.get(key)) is None:
+                break
+            # A batch load resolves to None for keys it didn't return, then
+            # the first waiter to look again starts a load the others share
+            if (value := await asyncio.shield(pending)) is not None:
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        self._start([key])
+        try:
+            value = await load()
+        except BaseException as e:
+            self._fail([key], e)
+            raise
+        self._finish({key: value})
+        return value
+
+    async def get_many(
+        self, keys: Iterable[K], load: Callable[[list[K]], Awaitable[dict[K, V]]]
+    ) -> dict[K, V]:
+        values: dict[K, V] = {}
+        pending: dict[K, asyncio.Future[V | None]] = {}
+        missing: list[K] = []
+        for key in keys:
+            if (value := self._cache.get(key)) is not None:
+                values[key] = value
+            elif key in self._pending:
+                pending[key] = self._pending[key]
+            else:
+                missing.append(key)
+        self.hits += len(values) + len(pending)
+        self.misses += len(missing)
+
+        if missing:
+            self._start(missing)
+            try:
+                loaded = await load(missing)
+            except BaseException as e:
+                self._fail(missing, e)
+                raise
+            self._finish({key: loaded.get(key) for key in missing})
+            values.update(loaded)
+
+        for key, future in pending.items():
+            try:
+                value = await asyncio.shield(future)
+            except Exception:
+                continue
+            if value is not None:
+                values[key] = value
+        return values
+
+    def _start(self, keys: list[K]):
+        loop = asyncio.get_running_loop()
+        futures = {key: loop.create_future() for key in keys}
+        self._pending.update(futures)
+        return futures
+
+    def _finish(self, values: dict[K, V | None]):
+        for key, value in values.items():
+            if value is not None and key not in self._invalidated:
+                self._store(key, value)
+            self._invalidated.discard(key)
+            self._pending.pop(key).set_result(value)
+
+    def _store(self, key: K, value: V):
+        self._cache[key] = value
+
+    def _fail(self, keys: list[K], exception: BaseException):
+        for key in keys:
+            self._invalidated.discard(key)
+            future = self._pending.pop(key)
+            if isinstance(exception, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exception)
+                # Waiters are optional, don't log the exception as never retrieved
+                future.exception()
+
+
+# Entries remember the tags (e.g. coin ids) they were built from, so a change
+# to one tag drops every entry built from it
+class TaggedAsyncCache(AsyncCache[K, V]):
+    def __init__(
+        self, maxsize: int, ttl: float, tags: Callable[[V], Iterable[Hashable]]
+    ):
+        super().__init__(maxsize, ttl)
+        self._tags = tags
+        self._keys_by_tag: dict[Hashable, set[K]] = defaultdict(set)
+
+    def _store(self, key: K, value: V):
+        super()._store(key, value)
+        for tag in self._tags(value):
+            self._keys_by_tag[tag].add(key)
+
+    def invalidate_tags(self, tags: Iterable[Hashable]):
+        # Loads in flight may have read the old state, their tags aren't known
+        # until they finish
+        self._invalidated.update(self._pending)
+        # Keys evicted by TTL may still be listed, invalidating them is a no-op
+        for tag in tags:
+            for key in self._keys_by_tag.pop(tag, ()):
+                self.invalidate(key)
@@ -16,8 +16,144 @@ load_dotenv()
 BOT_TOKEN = getenv("BOT_TOKEN")
 UPDATE_EACH_MINUTES = 5
 
+# DexScreener accepts up to 30 comma-separated pair addresses per request.
+# Coins are grouped by chain_id, the per-chain map overrides the chunk size.
+PAIRS_PER_REQUEST = 30
+PAIRS_PER_REQUEST_BY_CHAIN: dict[str, int] = {}
+
+# "polling" fetches every coin on the UPDATE_EACH_MINUTES cron,
+# "adaptive" polls each coin more often the closer it is to an alert,
+# "stream" receives pushed ticks from PRICE_STREAM_URL
+PRICE_SOURCE = os.getenv("PRICE_SOURCE", "polling")
+PRICE_STREAM_URL = os.getenv("PRICE_STREAM_URL", "")
+PRICE_STREAM_DEBOUNCE = 1.0
+PRICE_STREAM_RESUBSCRIBE = 60
+PRICE_STREAM_RECONNECT_DELAY = 5
+
+# Adaptive polling: interval = POLL_MIN_INTERVAL * distance to the nearest
+# alert level / recent volatility, clamped to [POLL_MIN_INTERVAL, POLL_MAX_INTERVAL]
+POLL_MIN_INTERVAL = 30
+POLL_MAX_INTERVAL = 15 * 60
+POLL_VOLATILITY_FLOOR = 0.005
+POLL_VOLATILITY_SMOOTHING = 0.3
+POLL_BATCH_SIZE = 300
+POLL_REFRESH_COINS = 60
+
+# With PRICE_WORKERS > 0 each worker process polls and evaluates its own
+# shard of coins and sends notifications back to the bot process
+PRICE_WORKERS = int(os.getenv("PRICE_WORKERS", "0"))
+WORKER_ALERT_INDEX_REFRESH = 60
+
+# Shared aiohttp session used by the price fetcher
+FETCH_CONCURRENCY = 10
+FETCH_CONNECTIONS_LIMIT = 20
+FETCH_DNS_CACHE_TTL = 300
+FETCH_KEEPALIVE_TIMEOUT = 60
+FETCH_TIMEOUT = 30
+
+# DexScreener calls are retried up to RETRY_ATTEMPTS times, all retries share
+# RETRY_BUDGET per update cycle
+RETRY_ATTEMPTS = 5
+RETRY_BUDGET = int(os.getenv("RETRY_BUDGET", "50"))
+
+# One circuit breaker per endpoint and chain_id: it opens after
+# BREAKER_FAILURE_THRESHOLD consecutive failures, fails fast for
+# BREAKER_RESET_TIMEOUT seconds, then lets BREAKER_HALF_OPEN_PROBES through
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 60
+BREAKER_HALF_OPEN_PROBES = 1
+
+# Prices fetched for new subscriptions and by the update cycle are shared
+PRICE_CACHE_SIZE = 50_000
+PRICE_CACHE_TTL = 60
+
+# Subscription lists rendered by the dialog, per user. Entries are dropped on
+# subscribe/unsubscribe and when a price of one of the coins is updated.
+SUBSCRIPTION_VIEWS_CACHE_SIZE = 10_000
+SUBSCRIPTION_VIEWS_CACHE_TTL = 300
+
+# Dialog state lives in the database ("sqlite") or only in memory ("memory").
+# Writes are batched every FSM_FLUSH_INTERVAL seconds, records untouched for
+# FSM_TTL seconds are evicted, FSM_CACHE_SIZE recent records stay in memory.
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_FLUSH_INTERVAL = 1.0
+FSM_TTL = 7 * 24 * 3600
+FSM_EVICT_EVERY = 3600
+FSM_CACHE_SIZE = 10_000
+
+# A fired alert re-arms once the price is back 2% above alert_price
+ALERT_REARM_HYSTERESIS = 0.02
+
+# Every update cycle appends its prices to the price_tick table. Ticks are
+# rolled up into OHLC buckets of each resolution (seconds) every
+# PRICE_HISTORY_ROLLUP_EVERY seconds and every level is kept for its retention
+PRICE_TICK_RETENTION = 2 * 24 * 3600
+# Streamed prices arrive about every second, a coin keeps its first tick of
+# each PRICE_TICK_INTERVAL
+PRICE_TICK_INTERVAL = 60
+PRICE_HISTORY_RETENTION = {
+    60: 7 * 24 * 3600,
+    3600: 90 * 24 * 3600,
+    86400: 5 * 365 * 24 * 3600,
+}
+PRICE_HISTORY_ROLLUP_EVERY = 10 * 60
+# Ticks of a cycle still in flight may be committed a bit after their timestamp
+PRICE_HISTORY_ROLLUP_DELAY = 60
+
+# Windows users can pick for percent change and moving average alerts,
+# history is kept long enough to warm them up after a restart
+ALERT_WINDOWS = {"1h": 3600, "4h": 4 * 3600, "24h": 24 * 3600}
+
+# "polling" pulls updates with getUpdates, "webhook" registers WEBHOOK_URL with
+# Telegram and serves it from WEBHOOK_HOST:WEBHOOK_PORT. Webhook updates wait in
+# a queue of WEBHOOK_QUEUE_SIZE for WEBHOOK_WORKERS handlers; when it stays full
+# for WEBHOOK_ENQUEUE_TIMEOUT seconds the request gets a 503 and Telegram
+# delivers the update again later. Telegram sends WEBHOOK_SECRET (1-256 of
+# A-Z, a-z, 0-9, _ and -) with every update, requests without it are refused.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = 1000
+WEBHOOK_ENQUEUE_TIMEOUT = 5
+WEBHOOK_DRAIN_TIMEOUT = 10
+# Update ids remembered to drop redeliveries
+WEBHOOK_DEDUP_SIZE = 10_000
+
+# /metrics is served on METRICS_PORT, 0 (the default) disables it. With
+# PRICE_WORKERS, fetch, cycle and breaker metrics are recorded in the worker
+# processes: worker i serves its own on METRICS_PORT + 1 + i, scrape them all.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Telegram allows 30 messages per second overall and about 1 per second per chat
+NOTIFY_RATE_LIMIT = 30
+NOTIFY_CHAT_INTERVAL = 1.0
+NOTIFY_WORKERS = 30
+NOTIFY_QUEUE_SIZE = 10_000
+
+# PRAGMAs applied to every new SQLite connection, picked by SQLITE_PROFILE
+SQLITE_PROFILES: dict[str, dict[str, str | int]] = {
+    "default": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # negative value is in KiB
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+}
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+SQLITE_CACHED_STATEMENTS = 256
+
 LOGGING_LEVEL = logging.INFO
 LOGGING_FILE = "logs/app.log"
+# Share of HTTP requests whose start/end are logged to the "trace" logger
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
 LOGGING_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -25,6 +161,9 @@ LOGGING_CONFIG = {
         "standard": {
             "format": "%(asctime)s [%(levelname)s] [%(name)s]: %(message)s",
         },
+        "json": {
+            "()": "src.utils.JsonFormatter",
+        },
     },
     "handlers": {
         "stream_handler": {
@@ -35,7 +174,7 @@ LOGGING_CONFIG = {
         },
         "file_handler": {
             "level": LOGGING_LEVEL,
-            "formatter": "standard",
+            "formatter": "json",
             "class": "logging.handlers.RotatingFileHandler",
             "filename": LOGGING_FILE,
             "maxBytes": 1024 * 1024 * 5,
@@ -1,3 +1,6 @@
+import os
+from enum import StrEnum
+
 from attr import dataclass
 
 
@@ -7,11 +10,33 @@ class Token:
     address: str
 
 
-BASE_API_URL = "https://api.dexscreener.com"
+class AlertKind(StrEnum):
+    BELOW = "below"
+    ABOVE = "above"
+    # price moved by at least alert_percent within alert_window seconds
+    CHANGE = "change"
+    # price crossed the moving average over alert_window seconds
+    CROSS_SMA = "cross_sma"
+    CROSS_EMA = "cross_ema"
+
+
+THRESHOLD_ALERT_KINDS = (AlertKind.BELOW, AlertKind.ABOVE)
+
+
+class BreakerState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+BASE_API_URL = os.getenv("DEXSCREENER_API_URL", "https://api.dexscreener.com")
 TOKEN_STATUS_ENDPOINT = f"{BASE_API_URL}/latest/dex/pairs/{{chain_id}}/{{pair_id}}"
 
 
-DATABASE_URI = "sqlite:///data/database.db"
+DATABASE_URI = os.getenv("DATABASE_URI", "sqlite+aiosqlite:///data/database.db")
+# Lowest bound-parameter limit across SQLite builds (before 3.32.0)
+SQLITE_MAX_VARIABLES = 999
+TELEGRAM_MESSAGE_LIMIT = 4096
 
 BLOCKCHAINS_TOKENS_MAP = {
     "ton": [Token("FPIBANK", "EQAyrrAjgSuyHrgGO1HimNbGV9tVLndZ3uocLaOyTw_FgegD")]
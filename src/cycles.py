@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from src.metrics import CYCLE_LAG_SECONDS, CYCLE_SECONDS, MISSED_CYCLES, registry
+
+logger = logging.getLogger(__name__)
+
+
+# Keeps a single update cycle in flight. A tick that arrives while a cycle is
+# running isn't started alongside it: once the running cycle ends, one
+# catch-up cycle runs that only refreshes coins which went stale meanwhile.
+class CycleCoordinator:
+    def __init__(self, period: float):
+        self.period = period
+        self.started_at: float | None = None
+        self.ended_at: float | None = None
+        self.duration: float | None = None
+        self.cycles = 0
+        self.missed = 0
+        self._lock = asyncio.Lock()
+        self._catch_up = False
+        registry.on_collect(self._collect_metrics)
+
+    def _collect_metrics(self):
+        CYCLE_LAG_SECONDS.set(self.lag)
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    @property
+    def lag(self):
+        # Seconds the cycle is behind its schedule
+        if self.running and self.started_at is not None:
+            elapsed = time.time() - self.started_at
+        else:
+            elapsed = self.duration or 0
+        return max(elapsed - self.period, 0)
+
+    async def run(self, cycle: Callable[[bool], Awaitable[None]]):
+        if self.running:
+            self.missed += 1
+            MISSED_CYCLES.inc()
+            self._catch_up = True
+            logger.warning("Update cycle is still running, %.1fs behind", self.lag)
+            return
+
+        async with self._lock:
+            stale_only = False
+            while True:
+                self._catch_up = False
+                await self._run_once(cycle, stale_only)
+                if not self._catch_up:
+                    break
+                stale_only = True
+
+    async def _run_once(
+        self, cycle: Callable[[bool], Awaitable[None]], stale_only: bool
+    ):
+        self.started_at = time.time()
+        start = time.perf_counter()
+        try:
+            await cycle(stale_only)
+        finally:
+            self.duration = time.perf_counter() - start
+            self.ended_at = time.time()
+            self.cycles += 1
+            CYCLE_SECONDS.observe(self.duration, str(stale_only).lower())
+            logger.info(
+                "Update cycle%s took %.1fs",
+                " (stale only)" if stale_only else "",
+                self.duration,
+            )
@@ -1,16 +1,85 @@
 import os
+import time
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy import Connection, event, inspect
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.schema import CreateColumn
 
+from src.config import SQLITE_CACHED_STATEMENTS, SQLITE_PROFILE, SQLITE_PROFILES
 from src.constants import DATABASE_URI
+from src.metrics import DB_QUERY_SECONDS
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def create_sqlite_engine(uri: str, profile: str = SQLITE_PROFILE):
+    pragmas = SQLITE_PROFILES[profile]
+    engine = create_async_engine(
+        uri, connect_args={"cached_statements": SQLITE_CACHED_STATEMENTS}
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info["query_started_at"].pop()
+        DB_QUERY_SECONDS.observe(
+            time.perf_counter() - started_at,
+            statement.lstrip().split(None, 1)[0].upper(),
+        )
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def drop_query_timer(context):
+        connection = context.connection
+        if connection is not None and (
+            started_at := connection.info.get("query_started_at")
+        ):
+            started_at.pop()
+
+    return engine
+
+
+def _add_missing_columns(connection: Connection):
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}"
+                )
+
+
+def _create_tables(connection: Connection):
+    Base.metadata.create_all(connection)
+    # create_all doesn't alter tables that already exist
+    _add_missing_columns(connection)
+    # create_all skips indexes added to tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(_create_tables)
+
+
 os.makedirs("data", exist_ok=True)
 
-engine = create_engine(DATABASE_URI)
-make_session = sessionmaker(engine, expire_on_commit=False)
+engine = create_sqlite_engine(DATABASE_URI)
+make_session = async_sessionmaker(engine, expire_on_commit=False)
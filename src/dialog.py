@@ -9,16 +9,29 @@ from aiogram_dialog.widgets.input import TextInput
 from aiogram_dialog.widgets.kbd import Back, Button, Column, Next, Select
 from aiogram_dialog.widgets.text import Const, Format
 
-from src.constants import BLOCKCHAINS_TOKENS_MAP, Token
+from src.config import ALERT_WINDOWS
+from src.constants import (
+    BLOCKCHAINS_TOKENS_MAP,
+    THRESHOLD_ALERT_KINDS,
+    AlertKind,
+)
 from src.database import make_session
-from src.schemas import Subscription
+from src.fetcher import PriceFetcher
 from src.service import (
-    get_user_subscriptions,
+    get_user_subscription_views,
     subscribe_user_to_coin,
     unsubscribe_user_from_coin,
 )
 from src.utils import cast_away_optional
 
+ALERT_KIND_LABELS = {
+    AlertKind.BELOW: "Price below",
+    AlertKind.ABOVE: "Price above",
+    AlertKind.CHANGE: "Price change ±%",
+    AlertKind.CROSS_SMA: "Crosses SMA",
+    AlertKind.CROSS_EMA: "Crosses EMA",
+}
+
 
 class SG(StatesGroup):
     HOME = State()
@@ -29,7 +42,10 @@ class SG(StatesGroup):
 
     BLOCKCHAINS = State()
     TOKENS = State()
+    ALERT_KINDS = State()
     SET_ALERT_PRICE = State()
+    ALERT_WINDOWS = State()
+    SET_ALERT_PERCENT = State()
     ALERT_PRICE_IS_SET = State()
 
 
@@ -47,25 +63,47 @@ def create_blockchains_buttons():
     ]
 
 
+# dialog_data is serialized into FSM storage on every step, so it only holds
+# ids (blockchain, token address, coin id) and views are looked up again
+async def get_subscription(tg_id: int, coin_id: int):
+    for subscription in await get_user_subscription_views(tg_id):
+        if subscription.coin_id == coin_id:
+            return subscription
+    return None
+
+
+def get_token(manager: DialogManager):
+    blockchain = manager.dialog_data["blockchain"]
+    token_address = manager.dialog_data["token_address"]
+    for token in BLOCKCHAINS_TOKENS_MAP[blockchain]:
+        if token.address == token_address:
+            return token
+    raise ValueError(f"Token {token_address} is not available on {blockchain}")
+
+
 async def clicked_subscription(
     callback: CallbackQuery,
     widget: Any,
     manager: DialogManager,
     item_id: str,
 ):
-    manager.dialog_data["subscription"] = manager.dialog_data["subscriptions"][int(item_id)]  # fmt: skip
+    manager.dialog_data["coin_id"] = int(item_id)
     await manager.switch_to(SG.SUBSCRIPTION)
 
 
 async def user_subscriptions_getter(**kwargs):
     tg_id = kwargs["event_from_user"].id
-    manager: DialogManager = kwargs["dialog_manager"]
+    return {"subscriptions": await get_user_subscription_views(tg_id)}
 
-    with make_session() as session:
-        subscriptions = get_user_subscriptions(tg_id, session)
 
-    manager.dialog_data["subscriptions"] = subscriptions
-    return {"subscriptions": enumerate(subscriptions)}
+async def subscription_getter(**kwargs):
+    tg_id = kwargs["event_from_user"].id
+    manager: DialogManager = kwargs["dialog_manager"]
+    subscription = await get_subscription(tg_id, manager.dialog_data["coin_id"])
+    return {
+        "subscription": subscription or "This subscription no longer exists.",
+        "subscribed": subscription is not None,
+    }
 
 
 async def clicked_unsubscribe(
@@ -74,15 +112,19 @@ async def clicked_unsubscribe(
     manager: DialogManager,
 ):
     tg_id = callback.from_user.id
-    subscription: Subscription = manager.dialog_data["subscription"]
+    subscription = await get_subscription(tg_id, manager.dialog_data["coin_id"])
+    if subscription is None:
+        await manager.switch_to(SG.SUBSCRIPTIONS)
+        return
 
-    with make_session() as session:
+    async with make_session() as session:
         await unsubscribe_user_from_coin(
             tg_id,
             subscription.chain_id,
             subscription.token_address,
             session,
         )
+    manager.dialog_data["token_name"] = subscription.token_name
     await manager.next()
 
 
@@ -92,18 +134,22 @@ async def clicked_token(
     manager: DialogManager,
     item_id: str,
 ):
-    manager.dialog_data["token"] = manager.dialog_data["tokens"][int(item_id)]
+    tokens = BLOCKCHAINS_TOKENS_MAP[manager.dialog_data["blockchain"]]
+    # Item ids stay indexes, addresses would overflow Telegram's callback data
+    manager.dialog_data["token_address"] = tokens[int(item_id)].address
     await manager.next()
 
 
 async def tokens_getter(**kwargs):
     manager: DialogManager = kwargs["dialog_manager"]
-    blockchain = manager.dialog_data["blockchain"]
-    tokens = BLOCKCHAINS_TOKENS_MAP[blockchain]
-    manager.dialog_data["tokens"] = tokens
+    tokens = BLOCKCHAINS_TOKENS_MAP[manager.dialog_data["blockchain"]]
     return {"tokens": enumerate(tokens)}
 
 
+async def token_getter(**kwargs):
+    return {"token": get_token(kwargs["dialog_manager"])}
+
+
 async def switch_to_blockchains(
     callback: CallbackQuery, button: Button, manager: DialogManager
 ):
@@ -116,6 +162,62 @@ async def switch_to_subscriptions(
     await manager.switch_to(SG.SUBSCRIPTIONS)
 
 
+async def clicked_alert_kind(
+    callback: CallbackQuery,
+    widget: Any,
+    manager: DialogManager,
+    item_id: str,
+):
+    manager.dialog_data["alert_kind"] = item_id
+    manager.dialog_data.pop("alert_window", None)
+    if AlertKind(item_id) in THRESHOLD_ALERT_KINDS:
+        await manager.switch_to(SG.SET_ALERT_PRICE)
+    else:
+        await manager.switch_to(SG.ALERT_WINDOWS)
+
+
+async def clicked_alert_window(
+    callback: CallbackQuery,
+    widget: Any,
+    manager: DialogManager,
+    item_id: str,
+):
+    manager.dialog_data["alert_window"] = ALERT_WINDOWS[item_id]
+    if manager.dialog_data["alert_kind"] == AlertKind.CHANGE:
+        await manager.switch_to(SG.SET_ALERT_PERCENT)
+    else:
+        await subscribe(callback.from_user.id, manager)
+        await manager.switch_to(SG.ALERT_PRICE_IS_SET)
+
+
+async def switch_to_alert_kinds(
+    callback: CallbackQuery, button: Button, manager: DialogManager
+):
+    await manager.switch_to(SG.ALERT_KINDS)
+
+
+async def subscribe(
+    tg_id: int,
+    manager: DialogManager,
+    alert_price: float | None = None,
+    alert_percent: float | None = None,
+):
+    fetcher: PriceFetcher = manager.middleware_data["fetcher"]
+
+    async with make_session() as session:
+        await subscribe_user_to_coin(
+            tg_id,
+            manager.dialog_data["blockchain"],
+            manager.dialog_data["token_address"],
+            alert_price,
+            fetcher,
+            session,
+            AlertKind(manager.dialog_data["alert_kind"]),
+            alert_percent,
+            manager.dialog_data.get("alert_window"),
+        )
+
+
 async def set_alert_price_error(
     message: Message,
     dialog_: Any,
@@ -131,19 +233,8 @@ async def set_alert_price_success(
     manager: DialogManager,
     data,
 ):
-    alert_price = data
-    blockchain = manager.dialog_data["blockchain"]
-    token: Token = manager.dialog_data["token"]
-
-    with make_session() as session:
-        await subscribe_user_to_coin(
-            cast_away_optional(message.from_user).id,
-            blockchain,
-            token.address,
-            alert_price,
-            session,
-        )
-    await manager.next()
+    await subscribe(cast_away_optional(message.from_user).id, manager, alert_price=data)
+    await manager.switch_to(SG.ALERT_PRICE_IS_SET)
 
 
 def validate_alert_price(value: str):
@@ -152,6 +243,33 @@ def validate_alert_price(value: str):
     return value
 
 
+async def set_alert_percent_error(
+    message: Message,
+    dialog_: Any,
+    manager: DialogManager,
+    error_: ValueError,
+):
+    await message.answer("Percent must be dot separated number greater than 0.")
+
+
+async def set_alert_percent_success(
+    message: Message,
+    dialog_: Any,
+    manager: DialogManager,
+    data,
+):
+    await subscribe(
+        cast_away_optional(message.from_user).id, manager, alert_percent=data
+    )
+    await manager.switch_to(SG.ALERT_PRICE_IS_SET)
+
+
+def validate_alert_percent(value: str):
+    if (percent := float(value)) <= 0:
+        raise ValueError("Percent must be greater than 0")
+    return percent
+
+
 dialog = Dialog(
     Window(
         Format("Hello, {event.from_user.full_name}"),
@@ -165,9 +283,9 @@ dialog = Dialog(
         Const("Your Subscriptions:"),
         Column(
             Select(
-                Format("{item[1].token_name}"),
+                Format("{item.token_name}"),
                 id="s_subscriptions",
-                item_id_getter=operator.itemgetter(0),
+                item_id_getter=operator.attrgetter("coin_id"),
                 items="subscriptions",
                 on_click=clicked_subscription,
             )
@@ -183,19 +301,19 @@ dialog = Dialog(
     ),
     #
     Window(
-        Format("{dialog_data[subscription]}"),
+        Format("{subscription}"),
         Button(
             text=Const("Unsubscribe"),
             id="unsubscribe",
             on_click=clicked_unsubscribe,
+            when="subscribed",
         ),
         Back(text=Const("Back")),
         state=SG.SUBSCRIPTION,
+        getter=subscription_getter,
     ),
     Window(
-        Format(
-            "You sucessfully unsubscribed from {dialog_data[subscription].token_name}."
-        ),
+        Format("You sucessfully unsubscribed from {dialog_data[token_name]}."),
         Button(
             text=Const("Back to subscriptions"),
             id="back_to_subscriptions_unsubscribed",
@@ -229,6 +347,20 @@ dialog = Dialog(
         state=SG.TOKENS,
         getter=tokens_getter,
     ),
+    Window(
+        Const("Alert me when:"),
+        Column(
+            Select(
+                Format("{item[1]}"),
+                id="s_alert_kinds",
+                item_id_getter=operator.itemgetter(0),
+                items=list(ALERT_KIND_LABELS.items()),
+                on_click=clicked_alert_kind,
+            )
+        ),
+        Back(text=Const("Back")),
+        state=SG.ALERT_KINDS,
+    ),
     Window(
         Const("Enter the USD alert price:"),
         TextInput(
@@ -241,12 +373,42 @@ dialog = Dialog(
         state=SG.SET_ALERT_PRICE,
     ),
     Window(
-        Format("You successfully subscribed to {dialog_data[token].name}."),
+        Const("Choose the window:"),
+        Column(
+            Select(
+                Format("{item}"),
+                id="s_alert_windows",
+                item_id_getter=str,
+                items=list(ALERT_WINDOWS),
+                on_click=clicked_alert_window,
+            )
+        ),
+        Button(
+            text=Const("Back"),
+            id="back_to_alert_kinds",
+            on_click=switch_to_alert_kinds,
+        ),
+        state=SG.ALERT_WINDOWS,
+    ),
+    Window(
+        Const("Enter the percent change:"),
+        TextInput(
+            id="set_percent",
+            type_factory=validate_alert_percent,
+            on_success=set_alert_percent_success,
+            on_error=set_alert_percent_error,
+        ),
+        Back(text=Const("Back")),
+        state=SG.SET_ALERT_PERCENT,
+    ),
+    Window(
+        Format("You successfully subscribed to {token.name}."),
         Button(
             text=Const("Back to subscriptions"),
             id="back_to_subscriptions_subscribed",
             on_click=switch_to_subscriptions,
         ),
         state=SG.ALERT_PRICE_IS_SET,
+        getter=token_getter,
     ),
 )
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Sequence
+
+import aiohttp
+
+from src.breaker import CircuitOpenError, get_breaker
+from src.cache import AsyncCache
+from src.config import (
+    FETCH_CONCURRENCY,
+    FETCH_CONNECTIONS_LIMIT,
+    FETCH_DNS_CACHE_TTL,
+    FETCH_KEEPALIVE_TIMEOUT,
+    FETCH_TIMEOUT,
+    PAIRS_PER_REQUEST,
+    PAIRS_PER_REQUEST_BY_CHAIN,
+    PRICE_CACHE_SIZE,
+    PRICE_CACHE_TTL,
+    TRACE_SAMPLE_RATE,
+)
+from src.constants import TOKEN_STATUS_ENDPOINT
+from src.metrics import FETCH_SECONDS, PRICE_CACHE_LOOKUPS, registry
+from src.models import Coin
+from src.schemas import PairRepsonse, TokenStatusResponse
+from src.utils import (
+    cast_away_optional,
+    chunked,
+    custom_retry,
+    get_aiohttp_trace_config,
+)
+
+logger = logging.getLogger(__name__)
+
+PAIRS_ENDPOINT = "pairs"
+
+
+class PriceFetcher:
+    def __init__(self, concurrency: int = FETCH_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: aiohttp.ClientSession | None = None
+        self.cache: AsyncCache[tuple[str, str], PairRepsonse] = AsyncCache(
+            PRICE_CACHE_SIZE, PRICE_CACHE_TTL
+        )
+        registry.on_collect(self._collect_metrics)
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=FETCH_CONNECTIONS_LIMIT,
+                ttl_dns_cache=FETCH_DNS_CACHE_TTL,
+                keepalive_timeout=FETCH_KEEPALIVE_TIMEOUT,
+            ),
+            timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT),
+            trace_configs=[get_aiohttp_trace_config()] if TRACE_SAMPLE_RATE else [],
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self._session = None
+
+    def _collect_metrics(self):
+        PRICE_CACHE_LOOKUPS.set(self.cache.hits, "hit")
+        PRICE_CACHE_LOOKUPS.set(self.cache.misses, "miss")
+
+    @property
+    def session(self):
+        return cast_away_optional(self._session)
+
+    async def fetch_coin_info(self, blockchain: str, token_address: str):
+        return await self.cache.get(
+            (blockchain, token_address),
+            lambda: self._fetch_coin_info(blockchain, token_address),
+        )
+
+    async def fetch_coins_info(self, coins: Sequence[Coin], fresh: bool = False):
+        keys = [(coin.chain_id, coin.token_address) for coin in coins]
+        if fresh:
+            # Skips cached prices but refreshes them for other readers
+            coins_info = await self._fetch_coins_info(keys)
+            for key, coin_info in coins_info.items():
+                self.cache[key] = coin_info
+        else:
+            coins_info = await self.cache.get_many(keys, self._fetch_coins_info)
+        return {
+            token_address: coin_info
+            for (_, token_address), coin_info in coins_info.items()
+        }
+
+    async def _fetch_coin_info(self, blockchain: str, token_address: str):
+        async with self._semaphore:
+            return await parse_coin_info(blockchain, token_address, self.session)
+
+    async def _fetch_coins_info(self, keys: list[tuple[str, str]]):
+        token_addresses_by_chain: dict[str, list[str]] = defaultdict(list)
+        for blockchain, token_address in keys:
+            token_addresses_by_chain[blockchain].append(token_address)
+
+        chunks = [
+            (blockchain, chunk)
+            for blockchain, token_addresses in token_addresses_by_chain.items()
+            for chunk in chunked(
+                token_addresses,
+                PAIRS_PER_REQUEST_BY_CHAIN.get(blockchain, PAIRS_PER_REQUEST),
+            )
+        ]
+        results = await asyncio.gather(
+            *(self._fetch_chunk(blockchain, chunk) for blockchain, chunk in chunks)
+        )
+
+        coins_info: dict[tuple[str, str], PairRepsonse] = {}
+        for (blockchain, _), result in zip(chunks, results):
+            coins_info.update(
+                ((blockchain, token_address), coin_info)
+                for token_address, coin_info in result.items()
+            )
+        return coins_info
+
+    async def _fetch_chunk(self, blockchain: str, token_addresses: list[str]):
+        try:
+            async with self._semaphore:
+                return await parse_coins_info(blockchain, token_addresses, self.session)
+        except CircuitOpenError as e:
+            logger.warning(
+                "Skipped %d %s pairs: %s", len(token_addresses), blockchain, e
+            )
+            return {}
+        except Exception:
+            logger.exception(
+                "Failed to fetch %d %s pairs", len(token_addresses), blockchain
+            )
+            return {}
+
+
+@custom_retry
+async def parse_coin_info(
+    blockchain: str,
+    token_address: str,
+    session: aiohttp.ClientSession,
+):
+    with (
+        get_breaker(PAIRS_ENDPOINT, blockchain).guard(),
+        FETCH_SECONDS.time(blockchain),
+    ):
+        async with session.get(
+            TOKEN_STATUS_ENDPOINT.format(chain_id=blockchain, pair_id=token_address)
+        ) as response:
+            match response.status:
+                case 200:
+                    body = await response.read()
+                    return TokenStatusResponse.from_json(body).pairs[0]
+                case _:
+                    response.raise_for_status()
+                    raise ValueError(f"Unexpected status code: {response.status}")
+
+
+@custom_retry
+async def parse_coins_info(
+    blockchain: str,
+    token_addresses: list[str],
+    session: aiohttp.ClientSession,
+):
+    with (
+        get_breaker(PAIRS_ENDPOINT, blockchain).guard(),
+        FETCH_SECONDS.time(blockchain),
+    ):
+        async with session.get(
+            TOKEN_STATUS_ENDPOINT.format(
+                chain_id=blockchain, pair_id=",".join(token_addresses)
+            )
+        ) as response:
+            match response.status:
+                case 200:
+                    body = await response.read()
+                    pairs = TokenStatusResponse.from_json(body).pairs
+                    # EVM pair addresses may come back in a different case
+                    requested = {
+                        address.lower(): address for address in token_addresses
+                    }
+                    return {
+                        requested[pair.pair_address.lower()]: pair
+                        for pair in pairs
+                        if pair.pair_address.lower() in requested
+                    }
+                case _:
+                    response.raise_for_status()
+                    raise ValueError(f"Unexpected status code: {response.status}")
@@ -0,0 +1,175 @@
+import logging
+import time
+from typing import Sequence
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import (
+    PRICE_HISTORY_RETENTION,
+    PRICE_HISTORY_ROLLUP_DELAY,
+    PRICE_TICK_INTERVAL,
+    PRICE_TICK_RETENTION,
+)
+from src.database import make_session
+from src.models import Coin, PriceBucket, PriceTick
+
+logger = logging.getLogger(__name__)
+
+# coin_id -> interval of its latest recorded tick
+recorded_intervals: dict[int, int] = {}
+
+# Bucket open/close are looked up by primary key at the first/last timestamp
+# of every (coin_id, bucket) group, high/low are the group extremes
+ROLLUP_TICKS = text("""
+    INSERT OR REPLACE INTO price_bucket
+        (coin_id, resolution, ts, open, high, low, close)
+    SELECT g.coin_id, :resolution, g.bucket, o.price, g.high, g.low, c.price
+    FROM (
+        SELECT
+            coin_id,
+            ts - ts % :resolution AS bucket,
+            min(ts) AS first_ts,
+            max(ts) AS last_ts,
+            max(price) AS high,
+            min(price) AS low
+        FROM price_tick
+        WHERE ts >= :start AND ts < :end
+        GROUP BY coin_id, bucket
+    ) AS g
+    JOIN price_tick AS o ON o.coin_id = g.coin_id AND o.ts = g.first_ts
+    JOIN price_tick AS c ON c.coin_id = g.coin_id AND c.ts = g.last_ts
+    """)
+ROLLUP_BUCKETS = text("""
+    INSERT OR REPLACE INTO price_bucket
+        (coin_id, resolution, ts, open, high, low, close)
+    SELECT g.coin_id, :resolution, g.bucket, o.open, g.high, g.low, c.close
+    FROM (
+        SELECT
+            coin_id,
+            ts - ts % :resolution AS bucket,
+            min(ts) AS first_ts,
+            max(ts) AS last_ts,
+            max(high) AS high,
+            min(low) AS low
+        FROM price_bucket
+        WHERE resolution = :source AND ts >= :start AND ts < :end
+        GROUP BY coin_id, bucket
+    ) AS g
+    JOIN price_bucket AS o
+        ON o.coin_id = g.coin_id AND o.resolution = :source AND o.ts = g.first_ts
+    JOIN price_bucket AS c
+        ON c.coin_id = g.coin_id AND c.resolution = :source AND c.ts = g.last_ts
+    """)
+
+
+async def record_price_ticks(
+    coins: Sequence[Coin],
+    prices: dict[str, float],
+    session: AsyncSession,
+    ts: int | None = None,
+):
+    ts = int(time.time()) if ts is None else ts
+    interval = ts // PRICE_TICK_INTERVAL
+    rows = [
+        {"coin_id": coin.id, "ts": ts, "price": price}
+        for coin in coins
+        if (price := prices.get(coin.token_address)) is not None
+        and recorded_intervals.get(coin.id) != interval
+    ]
+    if not rows:
+        return
+
+    connection = await session.connection()
+    await connection.execute(insert(PriceTick).prefix_with("OR REPLACE"), rows)
+    recorded_intervals.update((row["coin_id"], interval) for row in rows)
+
+
+async def rollup_price_history(now: int | None = None):
+    now = int(time.time()) if now is None else now
+    started = time.perf_counter()
+    async with make_session() as session:
+        source = None
+        for resolution in sorted(PRICE_HISTORY_RETENTION):
+            # Only complete buckets are written, each run continues after the
+            # latest bucket of the resolution
+            end = now - PRICE_HISTORY_ROLLUP_DELAY
+            end -= end % resolution
+            latest = await session.scalar(
+                select(func.max(PriceBucket.ts)).where(
+                    PriceBucket.resolution == resolution
+                )
+            )
+            start = 0 if latest is None else latest + resolution
+            if start < end:
+                params = {"resolution": resolution, "start": start, "end": end}
+                if source is None:
+                    await session.execute(ROLLUP_TICKS, params)
+                else:
+                    await session.execute(ROLLUP_BUCKETS, {**params, "source": source})
+            source = resolution
+
+        await session.execute(
+            delete(PriceTick).where(PriceTick.ts < now - PRICE_TICK_RETENTION)
+        )
+        for resolution, retention in PRICE_HISTORY_RETENTION.items():
+            await session.execute(
+                delete(PriceBucket).where(
+                    PriceBucket.resolution == resolution,
+                    PriceBucket.ts < now - retention,
+                )
+            )
+        await session.commit()
+    logger.info("Price history rolled up in %.2fs", time.perf_counter() - started)
+
+
+async def get_price_history(
+    coin_id: int,
+    start: int,
+    end: int,
+    session: AsyncSession,
+    now: int | None = None,
+):
+    # (ts, open, high, low, close) rows of the finest resolution still retained
+    # at start, raw ticks repeat their price in all four columns
+    now = int(time.time()) if now is None else now
+    if start >= now - PRICE_TICK_RETENTION:
+        stmt = (
+            select(
+                PriceTick.ts,
+                PriceTick.price,
+                PriceTick.price,
+                PriceTick.price,
+                PriceTick.price,
+            )
+            .where(
+                PriceTick.coin_id == coin_id,
+                PriceTick.ts >= start,
+                PriceTick.ts < end,
+            )
+            .order_by(PriceTick.ts)
+        )
+        return (await session.execute(stmt)).tuples().all()
+
+    resolutions = sorted(PRICE_HISTORY_RETENTION)
+    resolution = next(
+        (r for r in resolutions if start >= now - PRICE_HISTORY_RETENTION[r]),
+        resolutions[-1],
+    )
+    stmt = (
+        select(
+            PriceBucket.ts,
+            PriceBucket.open,
+            PriceBucket.high,
+            PriceBucket.low,
+            PriceBucket.close,
+        )
+        .where(
+            PriceBucket.coin_id == coin_id,
+            PriceBucket.resolution == resolution,
+            PriceBucket.ts >= start - start % resolution,
+            PriceBucket.ts < end,
+        )
+        .order_by(PriceBucket.ts)
+    )
+    return (await session.execute(stmt)).tuples().all()
@@ -0,0 +1,235 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]):
+    if not names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+# Metrics only update in-memory numbers, the text exposition format is
+# rendered when /metrics is scraped
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]: ...
+
+    def render(self):
+        return "\n".join(
+            (
+                f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.type}",
+                *self.samples(),
+            )
+        )
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] += amount
+
+    def set(self, value: float, *labels: str):
+        # For totals that a component already counts, mirrored at scrape time
+        self._values[labels] = value
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(buckets)
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, value: float, *labels: str):
+        if (counts := self._counts.get(labels)) is None:
+            counts = self._counts[labels] = [0] * (len(self._buckets) + 1)
+        counts[bisect_left(self._buckets, value)] += 1
+        self._sums[labels] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        labelnames = (*self.labelnames, "le")
+        for labels, counts in self._counts.items():
+            total = 0
+            for bucket, count in zip((*self._buckets, "+Inf"), counts):
+                total += count
+                bucket_labels = _format_labels(labelnames, (*labels, str(bucket)))
+                yield f"{self.name}_bucket{bucket_labels} {total}"
+            formatted = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{formatted} {self._sums[labels]}"
+            yield f"{self.name}_count{formatted} {total}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: Metric):
+        self._metrics.append(metric)
+
+    def on_collect(self, collector: Callable[[], None]):
+        # Collectors copy component state (lag, cache counters) into metrics
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+FETCH_SECONDS = Histogram(
+    "dexscreener_request_seconds",
+    "DexScreener request latency per attempt",
+    ("chain_id",),
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Database statement execution time", ("statement",)
+)
+ALERT_EVALUATION_SECONDS = Histogram(
+    "alert_evaluation_seconds", "Alert evaluation time per price batch"
+)
+NOTIFICATION_SEND_SECONDS = Histogram(
+    "notification_send_seconds", "Telegram sendMessage latency"
+)
+CYCLE_SECONDS = Histogram(
+    "update_cycle_seconds", "Polling update cycle duration", ("stale_only",)
+)
+RETRIES = Counter("retries_total", "Retried calls by function", ("function",))
+ALERTS_TRIGGERED = Counter(
+    "alerts_triggered_total", "Triggered alerts by kind", ("kind",)
+)
+RATE_LIMITED = Counter(
+    "rate_limited_total", "Rate limit responses by service", ("service",)
+)
+MISSED_CYCLES = Counter(
+    "update_cycles_missed_total", "Cycle ticks skipped while a cycle was running"
+)
+CYCLE_LAG_SECONDS = Gauge(
+    "update_cycle_lag_seconds", "Seconds the update cycle is behind its schedule"
+)
+PRICE_CACHE_LOOKUPS = Counter(
+    "price_cache_lookups_total", "Price cache lookups by result", ("result",)
+)
+NOTIFICATION_QUEUE_SIZE = Gauge(
+    "notification_queue_size", "Notifications waiting to be sent"
+)
+RETRIES_DENIED = Counter(
+    "retries_denied_total", "Retries skipped because the cycle budget was spent"
+)
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state, 0 closed, 1 half-open, 2 open",
+    ("breaker",),
+)
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker transitions by the state entered",
+    ("breaker", "state"),
+)
+UPDATE_QUEUE_SIZE = Gauge("webhook_update_queue_size", "Updates waiting for a worker")
+WEBHOOK_UPDATES = Counter(
+    "webhook_updates_total",
+    "Webhook deliveries by result: accepted, duplicate or rejected",
+    ("result",),
+)
+UPDATE_HANDLING_SECONDS = Histogram(
+    "update_handling_seconds", "Time spent handling one webhook update"
+)
+
+
+async def handle_metrics(request: web.Request):
+    return web.Response(
+        body=registry.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+class MetricsServer:
+    def __init__(self, host: str, port: int):
+        self._host = host
+        self._port = port
+        self._runner: web.AppRunner | None = None
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        logger.info("Serving metrics on http://%s:%s/metrics", self._host, self._port)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,8 +1,9 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, ForeignKey, func
+from sqlalchemy import DateTime, ForeignKey, Index, func, true
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from src.constants import AlertKind
 from src.database import Base
 
 
@@ -19,7 +20,7 @@ class User(Base):
 class Coin(Base):
     __tablename__ = "coin"
     id: Mapped[int] = mapped_column(primary_key=True, nullable=False)
-    chain_id: Mapped[str] = mapped_column(nullable=False)
+    chain_id: Mapped[str] = mapped_column(nullable=False, index=True)
     token_address: Mapped[str] = mapped_column(nullable=False, unique=True, index=True)
     token_name: Mapped[str] = mapped_column(nullable=False)
     price: Mapped[float] = mapped_column(nullable=False)
@@ -34,10 +35,63 @@ class Coin(Base):
 
 class UserCoin(Base):
     __tablename__ = "user_coin"
+    __table_args__ = (
+        Index("ix_user_coin_coin_id_alert_price", "coin_id", "alert_price"),
+    )
     user_id: Mapped[int] = mapped_column(
         ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
     )
     coin_id: Mapped[int] = mapped_column(
         ForeignKey("coin.id", ondelete="CASCADE"), primary_key=True
     )
+    alert_kind: Mapped[str] = mapped_column(
+        nullable=False, default=AlertKind.BELOW, server_default=AlertKind.BELOW
+    )
     alert_price: Mapped[float] = mapped_column(nullable=True)
+    alert_percent: Mapped[float | None] = mapped_column(nullable=True)
+    alert_window: Mapped[int | None] = mapped_column(nullable=True)  # seconds
+    alert_armed: Mapped[bool] = mapped_column(
+        nullable=False, default=True, server_default=true()
+    )
+    alert_fired_at: Mapped[datetime | None] = mapped_column(nullable=True)
+
+
+class PriceTick(Base):
+    __tablename__ = "price_tick"
+    __table_args__ = (
+        Index("ix_price_tick_ts", "ts"),
+        {"sqlite_with_rowid": False},
+    )
+    coin_id: Mapped[int] = mapped_column(
+        ForeignKey("coin.id", ondelete="CASCADE"), primary_key=True
+    )
+    ts: Mapped[int] = mapped_column(primary_key=True)  # epoch seconds
+    price: Mapped[float] = mapped_column(nullable=False)
+
+
+class PriceBucket(Base):
+    __tablename__ = "price_bucket"
+    __table_args__ = (
+        Index("ix_price_bucket_resolution_ts", "resolution", "ts"),
+        {"sqlite_with_rowid": False},
+    )
+    coin_id: Mapped[int] = mapped_column(
+        ForeignKey("coin.id", ondelete="CASCADE"), primary_key=True
+    )
+    resolution: Mapped[int] = mapped_column(primary_key=True)  # seconds
+    ts: Mapped[int] = mapped_column(primary_key=True)  # bucket start, epoch seconds
+    open: Mapped[float] = mapped_column(nullable=False)
+    high: Mapped[float] = mapped_column(nullable=False)
+    low: Mapped[float] = mapped_column(nullable=False)
+    close: Mapped[float] = mapped_column(nullable=False)
+
+
+class FsmRecord(Base):
+    __tablename__ = "fsm_record"
+    __table_args__ = (
+        Index("ix_fsm_record_expires_at", "expires_at"),
+        {"sqlite_with_rowid": False},
+    )
+    key: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[bytes] = mapped_column(nullable=False)
+    expires_at: Mapped[int] = mapped_column(nullable=False)  # epoch seconds
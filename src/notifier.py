@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Protocol
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from src.config import (
+    NOTIFY_CHAT_INTERVAL,
+    NOTIFY_QUEUE_SIZE,
+    NOTIFY_RATE_LIMIT,
+    NOTIFY_WORKERS,
+)
+from src.metrics import (
+    NOTIFICATION_QUEUE_SIZE,
+    NOTIFICATION_SEND_SECONDS,
+    RATE_LIMITED,
+    registry,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier(Protocol):
+    async def send(self, chat_id: int, text: str): ...
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(
+                    self._capacity,
+                    self._tokens
+                    + (now - max(self._updated_at, self._paused_until)) * self._rate,
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+# Messages to one chat go out in order and NOTIFY_CHAT_INTERVAL apart. A chat
+# waiting out its interval is scheduled back onto the ready queue instead of
+# holding a worker, so workers only ever wait on the global rate limit.
+class NotificationDispatcher:
+    def __init__(
+        self,
+        bot: Bot,
+        rate_limit: float = NOTIFY_RATE_LIMIT,
+        chat_interval: float = NOTIFY_CHAT_INTERVAL,
+        workers: int = NOTIFY_WORKERS,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+    ):
+        self._bot = bot
+        self._bucket = TokenBucket(rate_limit, 1)
+        self._chat_interval = chat_interval
+        # Unsent messages of chats with one in flight, ready or waiting
+        self._backlogs: dict[int, deque[str]] = {}
+        self._chat_sent_at: dict[int, float] = {}
+        # Chats whose next message can be sent now
+        self._ready: asyncio.Queue[int] = asyncio.Queue()
+        # send() waits while queue_size messages are unsent
+        self._capacity = asyncio.Semaphore(queue_size)
+        self._unsent = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers_count = workers
+        self._workers: list[asyncio.Task] = []
+        registry.on_collect(self._collect_metrics)
+
+    def _collect_metrics(self):
+        NOTIFICATION_QUEUE_SIZE.set(self._unsent)
+
+    async def __aenter__(self):
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self._workers_count)
+        ]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def send(self, chat_id: int, text: str):
+        await self._capacity.acquire()
+        self._unsent += 1
+        self._idle.clear()
+        if (backlog := self._backlogs.get(chat_id)) is not None:
+            backlog.append(text)
+            return
+        self._backlogs[chat_id] = deque([text])
+        self._schedule(chat_id)
+
+    async def join(self):
+        await self._idle.wait()
+
+    def _schedule(self, chat_id: int):
+        delay = 0.0
+        if (sent_at := self._chat_sent_at.get(chat_id)) is not None:
+            delay = sent_at + self._chat_interval - time.monotonic()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(
+                delay, self._ready.put_nowait, chat_id
+            )
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _work(self):
+        while True:
+            chat_id = await self._ready.get()
+            backlog = self._backlogs[chat_id]
+            try:
+                await self._deliver(chat_id, backlog.popleft())
+            except Exception:
+                logger.exception("Failed to send message to %s", chat_id)
+            finally:
+                self._sent(chat_id, backlog)
+
+    def _sent(self, chat_id: int, backlog: deque[str]):
+        sent_at = self._chat_sent_at[chat_id] = time.monotonic()
+        self._capacity.release()
+        self._unsent -= 1
+        if not self._unsent:
+            self._idle.set()
+        if backlog:
+            self._schedule(chat_id)
+            return
+        del self._backlogs[chat_id]
+        # A chat's send time only spaces out its next message, drop it after
+        asyncio.get_running_loop().call_later(
+            self._chat_interval, self._forget_chat, chat_id, sent_at
+        )
+
+    def _forget_chat(self, chat_id: int, sent_at: float):
+        if chat_id not in self._backlogs and self._chat_sent_at.get(chat_id) == sent_at:
+            del self._chat_sent_at[chat_id]
+
+    async def _deliver(self, chat_id: int, text: str):
+        while True:
+            await self._bucket.acquire()
+            try:
+                with NOTIFICATION_SEND_SECONDS.time():
+                    await self._bot.send_message(
+                        chat_id, text, disable_web_page_preview=True
+                    )
+                return
+            except TelegramRetryAfter as e:
+                RATE_LIMITED.inc("telegram")
+                logger.warning("Rate limited by Telegram for %ss", e.retry_after)
+                self._bucket.pause(e.retry_after)
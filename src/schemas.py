@@ -1,6 +1,10 @@
 from datetime import datetime
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic_core import from_json
+
+from src.constants import AlertKind
+from src.utils import format_window
 
 
 class BaseTokenResponse(BaseModel):
@@ -8,6 +12,7 @@ class BaseTokenResponse(BaseModel):
 
 
 class PairRepsonse(BaseModel):
+    pair_address: str = Field(alias="pairAddress")
     price_usd: float = Field(alias="priceUsd")
     base_token: BaseTokenResponse = Field(alias="baseToken")
 
@@ -15,27 +20,60 @@ class PairRepsonse(BaseModel):
 class TokenStatusResponse(BaseModel):
     pairs: list[PairRepsonse]
 
+    @field_validator("pairs", mode="before")
+    @classmethod
+    def null_pairs(cls, value):
+        # DexScreener returns "pairs": null when none of the pairs exist
+        return value or []
+
+    @classmethod
+    def from_json(cls, body: bytes | str):
+        # Parsing first and validating the dicts is ~2x faster than
+        # model_validate_json, which is slow at skipping the nested fields we
+        # don't declare (txns, volume, info, ...)
+        return cls.model_validate(from_json(body))
+
 
 class Subscription(BaseModel):
+    coin_id: int = Field(validation_alias="id")
     chain_id: str
     token_name: str
     token_address: str
     price: float
+    alert_kind: AlertKind | None = None
     alert_price: float | None = None
+    alert_percent: float | None = None
+    alert_window: int | None = None
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
     def __str__(self) -> str:
-        if self.alert_price is None:
+        if self.alert_kind is None:
             raise ValueError(
-                "String representation is not available until alert_price is set"
+                "String representation is not available until alert_kind is set"
             )
 
+        match self.alert_kind:
+            case AlertKind.BELOW:
+                alert = f"Alert Price: below {self.alert_price} USD"
+            case AlertKind.ABOVE:
+                alert = f"Alert Price: above {self.alert_price} USD"
+            case AlertKind.CHANGE:
+                alert = (
+                    f"Alert: ±{self.alert_percent}% "
+                    f"in {format_window(self.alert_window or 0)}"
+                )
+            case _:
+                average = "EMA" if self.alert_kind == AlertKind.CROSS_EMA else "SMA"
+                alert = (
+                    f"Alert: crossing {format_window(self.alert_window or 0)} {average}"
+                )
+
         return (
             f"{self.token_name} ({self.chain_id.upper()}):\n"
             f"Address: {self.token_address}\n"
             f"Price: {self.price} USD\n"
-            f"Alert Price: {self.alert_price} USD\n"
+            f"{alert}\n"
             f"Last Updated: {self.updated_at.strftime('%d-%m-%Y %H:%M:%S')} UTC"
         )
@@ -1,32 +1,67 @@
-import asyncio
-
-import aiohttp
-from aiogram import Bot
-from sqlalchemy import select, update
-from sqlalchemy.orm import Session
-
-from src.constants import TOKEN_STATUS_ENDPOINT
+import logging
+import time
+from collections import defaultdict
+from itertools import groupby
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.alert_index import AlertRow, Trigger, alert_index
+from src.cache import TaggedAsyncCache
+from src.config import (
+    ALERT_WINDOWS,
+    SUBSCRIPTION_VIEWS_CACHE_SIZE,
+    SUBSCRIPTION_VIEWS_CACHE_TTL,
+)
+from src.constants import (
+    SQLITE_MAX_VARIABLES,
+    TELEGRAM_MESSAGE_LIMIT,
+    THRESHOLD_ALERT_KINDS,
+    AlertKind,
+)
 from src.database import make_session
-from src.models import Coin, User, UserCoin
-from src.schemas import Subscription, TokenStatusResponse
-from src.utils import custom_retry, get_aiohttp_trace_config
-
-
-def add_user(tg_id: int, session: Session):
+from src.fetcher import PriceFetcher
+from src.history import record_price_ticks
+from src.metrics import ALERT_EVALUATION_SECONDS, ALERTS_TRIGGERED
+from src.models import Coin, PriceTick, User, UserCoin
+from src.notifier import Notifier
+from src.schemas import Subscription
+from src.utils import (
+    Shard,
+    cast_away_optional,
+    chunked,
+    format_window,
+    join_lines,
+)
+
+logger = logging.getLogger(__name__)
+
+subscription_views: TaggedAsyncCache[int, list[Subscription]] = TaggedAsyncCache(
+    SUBSCRIPTION_VIEWS_CACHE_SIZE,
+    SUBSCRIPTION_VIEWS_CACHE_TTL,
+    tags=lambda subscriptions: [s.coin_id for s in subscriptions],
+)
+
+
+async def add_user(tg_id: int, session: AsyncSession):
     session.add(User(tg_id=tg_id))
-    session.commit()
+    await session.commit()
 
 
-def get_user(tg_id: int, session: Session):
+async def get_user(tg_id: int, session: AsyncSession):
     stmt = select(User).where(User.tg_id == tg_id)
-    return session.execute(stmt).scalar_one()
+    return (await session.execute(stmt)).scalar_one()
 
 
-async def add_coin(blockchain: str, token_address: str, db_session: Session):
-    async with aiohttp.ClientSession(
-        trace_configs=[get_aiohttp_trace_config()]
-    ) as session:
-        res = await parse_coin_info(blockchain, token_address, session)
+async def add_coin(
+    blockchain: str,
+    token_address: str,
+    fetcher: PriceFetcher,
+    db_session: AsyncSession,
+):
+    res = await fetcher.fetch_coin_info(blockchain, token_address)
 
     coin = Coin(
         chain_id=blockchain,
@@ -35,132 +70,301 @@ async def add_coin(blockchain: str, token_address: str, db_session: Session):
         price=res.price_usd,
     )
     db_session.add(coin)
-    db_session.commit()
+    await db_session.commit()
     return coin
 
 
-async def get_coin(blockchain: str, token_address: str, session: Session):
+async def get_coin(
+    blockchain: str,
+    token_address: str,
+    fetcher: PriceFetcher,
+    session: AsyncSession,
+):
     stmt = select(Coin).where(Coin.token_address == token_address)
-    res = session.execute(stmt).scalar_one_or_none()
+    res = (await session.execute(stmt)).scalar_one_or_none()
 
     if res is None:
-        return await add_coin(blockchain, token_address, session)
+        return await add_coin(blockchain, token_address, fetcher, session)
     else:
         return res
 
 
-def get_coins(session: Session):
+async def get_coins(
+    session: AsyncSession,
+    shard: Shard | None = None,
+    updated_before: datetime | None = None,
+):
     stmt = select(Coin)
-    return session.execute(stmt).scalars().all()
+    if updated_before is not None:
+        stmt = stmt.where(Coin.updated_at < updated_before)
+    coins = (await session.execute(stmt)).scalars().all()
+    if shard is None:
+        return coins
+    return [coin for coin in coins if shard.owns(coin.token_address)]
 
 
-def update_coin_price(token_address: str, price: float, session: Session):
+async def update_coin_price(token_address: str, price: float, session: AsyncSession):
     stmt = update(Coin).where(Coin.token_address == token_address).values(price=price)
-    result = session.execute(stmt)
+    result = await session.execute(stmt)
 
     if result.rowcount == 0:
         raise ValueError(f"Coin with token address {token_address} not found")
 
-    session.commit()
-
-
-async def update_prices_and_notify_subscribers(bot: Bot):
-    with make_session() as db_session:
-        coins = get_coins(db_session)
-        for coin in coins:
-            async with aiohttp.ClientSession(
-                trace_configs=[get_aiohttp_trace_config()]
-            ) as session:
-                coin_info = await parse_coin_info(
-                    coin.chain_id,
-                    coin.token_address,
-                    session,
-                )
-                update_coin_price(coin.token_address, coin_info.price_usd, db_session)
-            for user in coin.users:
-                stmt = select(UserCoin).where(
-                    UserCoin.user_id == user.id, UserCoin.coin_id == coin.id
-                )
-                user_coin = db_session.execute(stmt).scalar_one()
-                alert_price = user_coin.alert_price
-
-                if coin_info.price_usd < alert_price:
-                    await notify_subscriber(
-                        user.tg_id, coin.token_name, alert_price, bot
-                    )
-
-
-async def notify_subscriber(tg_id: int, token_name: str, alert_price: float, bot: Bot):
-    text = f"{token_name} now lower than {alert_price}!"
-    await bot.send_message(tg_id, text, disable_web_page_preview=True)
-    await asyncio.sleep(0.05)  # 20 messages per second (Limit: 30 messages per second)
+    await session.commit()
+
+
+async def update_coin_prices(prices: dict[str, float], session: AsyncSession):
+    existing: set[str] = set()
+    for chunk in chunked(prices, SQLITE_MAX_VARIABLES):
+        stmt = select(Coin.token_address).where(Coin.token_address.in_(chunk))
+        existing.update((await session.execute(stmt)).scalars())
+
+    if existing:
+        stmt = (
+            update(Coin)
+            .where(Coin.token_address == bindparam("b_token_address"))
+            .values(price=bindparam("b_price"))
+        )
+        connection = await session.connection()
+        await connection.execute(
+            stmt,
+            [
+                {"b_token_address": token_address, "b_price": prices[token_address]}
+                for token_address in existing
+            ],
+        )
+    await session.commit()
+
+    return [token_address for token_address in prices if token_address not in existing]
+
+
+async def update_prices_and_notify_subscribers(
+    coins: Sequence[Coin],
+    prices: dict[str, float],
+    dispatcher: Notifier,
+):
+    coin_prices = {
+        coin.id: price
+        for coin in coins
+        if (price := prices.get(coin.token_address)) is not None
+    }
+    token_names = {coin.id: coin.token_name for coin in coins}
+    with ALERT_EVALUATION_SECONDS.time():
+        triggered, fired, rearmed = alert_index.evaluate(coin_prices, time.time())
+    alerts: dict[int, list[tuple[str, Trigger]]] = defaultdict(list)
+    for trigger in triggered:
+        ALERTS_TRIGGERED.inc(trigger.kind)
+        alerts[trigger.tg_id].append((token_names[trigger.coin_id], trigger))
+
+    try:
+        async with make_session() as db_session:
+            # Alert states and price ticks are committed together with the prices
+            await set_alerts_armed(fired, False, db_session)
+            await set_alerts_armed(rearmed, True, db_session)
+            await record_price_ticks(coins, prices, db_session)
+            missing = await update_coin_prices(prices, db_session)
+    except BaseException:
+        # The alerts fire again on the next prices instead of being lost
+        alert_index.set_armed(fired, True)
+        alert_index.set_armed(rearmed, False)
+        raise
+    if missing:
+        logger.warning("Coins removed during update: %s", ", ".join(missing))
+    subscription_views.invalidate_tags(coin_prices)
+
+    for tg_id, user_alerts in alerts.items():
+        await notify_subscriber(tg_id, user_alerts, dispatcher)
+
+
+async def set_alerts_armed(
+    alerts: Sequence[tuple[int, int]], armed: bool, session: AsyncSession
+):
+    if not alerts:
+        return
+
+    user_id = select(User.id).where(User.tg_id == bindparam("b_tg_id"))
+    stmt = (
+        update(UserCoin)
+        .where(
+            UserCoin.coin_id == bindparam("b_coin_id"),
+            UserCoin.user_id == user_id.scalar_subquery(),
+        )
+        .values(alert_armed=armed)
+    )
+    if not armed:
+        stmt = stmt.values(alert_fired_at=func.now())
+
+    connection = await session.connection()
+    await connection.execute(
+        stmt, [{"b_coin_id": coin_id, "b_tg_id": tg_id} for coin_id, tg_id in alerts]
+    )
+
+
+async def load_alert_index(session: AsyncSession, shard: Shard | None = None):
+    stmt = (
+        select(
+            UserCoin.coin_id,
+            User.tg_id,
+            UserCoin.alert_kind,
+            UserCoin.alert_price,
+            UserCoin.alert_percent,
+            UserCoin.alert_window,
+            UserCoin.alert_armed,
+            Coin.token_address,
+        )
+        .join(User, User.id == UserCoin.user_id)
+        .join(Coin, Coin.id == UserCoin.coin_id)
+        .where(
+            (UserCoin.alert_price.is_not(None))
+            | (UserCoin.alert_kind.not_in(list(THRESHOLD_ALERT_KINDS)))
+        )
+    )
+    alert_index.load(
+        AlertRow(coin_id, tg_id, AlertKind(kind), alert_price, percent, window, armed)
+        for coin_id, tg_id, kind, alert_price, percent, window, armed, token_address in (
+            await session.execute(stmt)
+        ).tuples()
+        if shard is None or shard.owns(token_address)
+    )
+    await warm_alert_index(session)
+
+
+async def warm_alert_index(session: AsyncSession):
+    # Replays recent price history into newly created alert windows
+    since = int(time.time()) - max(ALERT_WINDOWS.values())
+    for coin_ids in chunked(alert_index.pop_cold(), SQLITE_MAX_VARIABLES - 1):
+        stmt = (
+            select(PriceTick.coin_id, PriceTick.ts, PriceTick.price)
+            .where(PriceTick.coin_id.in_(coin_ids), PriceTick.ts >= since)
+            .order_by(PriceTick.coin_id, PriceTick.ts)
+        )
+        rows = (await session.execute(stmt)).tuples()
+        for coin_id, samples in groupby(rows, key=lambda row: row[0]):
+            alert_index.warm(coin_id, ((ts, price) for _, ts, price in samples))
+
+
+def format_trigger(token_name: str, trigger: Trigger):
+    match trigger.kind:
+        case AlertKind.BELOW:
+            return f"{token_name} now lower than {trigger.level}!"
+        case AlertKind.ABOVE:
+            return f"{token_name} now higher than {trigger.level}!"
+        case AlertKind.CHANGE:
+            change = (trigger.price / trigger.level - 1) * 100
+            return (
+                f"{token_name} moved {change:+.2f}% in "
+                f"{format_window(cast_away_optional(trigger.window))}!"
+            )
+        case _:
+            direction = "above" if trigger.price > trigger.level else "below"
+            average = "EMA" if trigger.kind == AlertKind.CROSS_EMA else "SMA"
+            return (
+                f"{token_name} crossed {direction} its "
+                f"{format_window(cast_away_optional(trigger.window))} {average} "
+                f"({trigger.level:.6g})!"
+            )
+
+
+async def notify_subscriber(
+    tg_id: int,
+    alerts: Sequence[tuple[str, Trigger]],
+    dispatcher: Notifier,
+):
+    lines = (format_trigger(token_name, trigger) for token_name, trigger in alerts)
+    for text in join_lines(lines, TELEGRAM_MESSAGE_LIMIT):
+        await dispatcher.send(tg_id, text)
 
 
 async def subscribe_user_to_coin(
     tg_id: int,
     blockchain: str,
     token_address: str,
-    alert_price: float,
-    session: Session,
+    alert_price: float | None,
+    fetcher: PriceFetcher,
+    session: AsyncSession,
+    kind: AlertKind = AlertKind.BELOW,
+    alert_percent: float | None = None,
+    alert_window: int | None = None,
 ):
-    user = get_user(tg_id, session)
-    coin = await get_coin(blockchain, token_address, session)
-    user.coins.append(coin)
-
-    stmt = select(UserCoin).where(
-        UserCoin.user_id == user.id, UserCoin.coin_id == coin.id
-    )
-    user_coin = session.execute(stmt).scalar_one()
+    user = await get_user(tg_id, session)
+    coin = await get_coin(blockchain, token_address, fetcher, session)
+
+    user_coin = await session.get(UserCoin, (user.id, coin.id))
+    if user_coin is None:
+        user_coin = UserCoin(user_id=user.id, coin_id=coin.id)
+        session.add(user_coin)
+    user_coin.alert_kind = kind
     user_coin.alert_price = alert_price
-
-    session.commit()
+    user_coin.alert_percent = alert_percent
+    user_coin.alert_window = alert_window
+    user_coin.alert_armed = True
+    user_coin.alert_fired_at = None
+
+    await session.commit()
+    subscription_views.invalidate(tg_id)
+    alert_index.add(
+        AlertRow(
+            coin.id,
+            tg_id,
+            kind,
+            None if alert_price is None else float(alert_price),
+            alert_percent,
+            alert_window,
+            True,
+        )
+    )
+    await warm_alert_index(session)
 
 
 async def unsubscribe_user_from_coin(
-    tg_id: int, blockchain: str, token_address: str, session: Session
+    tg_id: int, blockchain: str, token_address: str, session: AsyncSession
 ):
-    user = get_user(tg_id, session)
-    coin = await get_coin(blockchain, token_address, session)
-    if coin in user.coins:
-        user.coins.remove(coin)
-        session.commit()
-    else:
+    user = await get_user(tg_id, session)
+    stmt = select(Coin).where(Coin.token_address == token_address)
+    coin = (await session.execute(stmt)).scalar_one()
+
+    user_coin = await session.get(UserCoin, (user.id, coin.id))
+    if user_coin is None:
         raise ValueError(
             f"User with id {tg_id} is not subscribed to coin with token_address {token_address}"
         )
-    session.commit()
-
-
-def get_user_subscriptions(tg_id: int, session: Session):
-    stmt = select(User).where(User.tg_id == tg_id)
-    user = session.execute(stmt).scalar_one()
+    await session.delete(user_coin)
+    await session.commit()
+    subscription_views.invalidate(tg_id)
+    alert_index.remove(coin.id, tg_id)
+
+
+async def get_user_subscriptions(tg_id: int, session: AsyncSession):
+    stmt = (
+        select(
+            Coin,
+            UserCoin.alert_kind,
+            UserCoin.alert_price,
+            UserCoin.alert_percent,
+            UserCoin.alert_window,
+        )
+        .join(UserCoin, UserCoin.coin_id == Coin.id)
+        .join(User, User.id == UserCoin.user_id)
+        .where(User.tg_id == tg_id)
+    )
 
     subscriptions: list[Subscription] = []
-    for coin in user.coins:
+    for coin, kind, alert_price, alert_percent, alert_window in (
+        await session.execute(stmt)
+    ).tuples():
         subscription = Subscription.model_validate(coin)
-        stmt = select(UserCoin).where(
-            UserCoin.user_id == user.id, UserCoin.coin_id == coin.id
-        )
-        user_coin = session.execute(stmt).scalar_one()
-        subscription.alert_price = user_coin.alert_price
+        subscription.alert_kind = AlertKind(kind)
+        subscription.alert_price = alert_price
+        subscription.alert_percent = alert_percent
+        subscription.alert_window = alert_window
         subscriptions.append(subscription)
 
     return subscriptions
 
 
-@custom_retry
-async def parse_coin_info(
-    blockchain: str,
-    token_address: str,
-    session: aiohttp.ClientSession,
-):
-    async with session.get(
-        TOKEN_STATUS_ENDPOINT.format(chain_id=blockchain, pair_id=token_address)
-    ) as response:
-        match response.status:
-            case 200:
-                data = await response.json()
-                return TokenStatusResponse(**data).pairs[0]
-            case _:
-                response.raise_for_status()
-                raise ValueError(f"Unexpected status code: {response.status}")
+async def get_user_subscription_views(tg_id: int):
+    async def load():
+        async with make_session() as session:
+            return await get_user_subscriptions(tg_id, session)
+
+    return await subscription_views.get(tg_id, load)
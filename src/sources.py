@@ -0,0 +1,348 @@
+import asyncio
+import heapq
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Awaitable, Callable, Sequence
+
+import aiohttp
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from src.alert_index import alert_index
+from src.config import (
+    POLL_BATCH_SIZE,
+    POLL_MAX_INTERVAL,
+    POLL_MIN_INTERVAL,
+    POLL_REFRESH_COINS,
+    POLL_VOLATILITY_FLOOR,
+    POLL_VOLATILITY_SMOOTHING,
+    PRICE_SOURCE,
+    PRICE_STREAM_DEBOUNCE,
+    PRICE_STREAM_RECONNECT_DELAY,
+    PRICE_STREAM_RESUBSCRIBE,
+    PRICE_STREAM_URL,
+    UPDATE_EACH_MINUTES,
+)
+from src.cycles import CycleCoordinator
+from src.database import make_session
+from src.fetcher import PriceFetcher
+from src.models import Coin
+from src.schemas import TokenStatusResponse
+from src.service import get_coins
+from src.utils import Shard
+
+logger = logging.getLogger(__name__)
+
+PricesHandler = Callable[[Sequence[Coin], dict[str, float]], Awaitable[None]]
+
+
+class PriceSource(ABC):
+    @abstractmethod
+    async def start(self, on_prices: PricesHandler): ...
+
+    @abstractmethod
+    async def stop(self): ...
+
+
+class PollingPriceSource(PriceSource):
+    def __init__(
+        self,
+        fetcher: PriceFetcher,
+        scheduler: AsyncIOScheduler,
+        shard: Shard | None = None,
+    ):
+        self._fetcher = fetcher
+        self._scheduler = scheduler
+        self._shard = shard
+        self.coordinator = CycleCoordinator(UPDATE_EACH_MINUTES * 60)
+
+    async def start(self, on_prices: PricesHandler):
+        self._scheduler.add_job(
+            self.coordinator.run,
+            CronTrigger(minute=f"*/{UPDATE_EACH_MINUTES}"),
+            args=(partial(self.poll, on_prices),),
+            id="update_prices_and_notify_subscribers",
+            # Overlapping runs must reach the coordinator to be caught up
+            max_instances=2,
+            coalesce=True,
+        )
+
+    async def stop(self):
+        self._scheduler.remove_job("update_prices_and_notify_subscribers")
+
+    async def poll(self, on_prices: PricesHandler, stale_only: bool = False):
+        stale_before = None
+        if stale_only:
+            # updated_at is stored as naive UTC
+            stale_before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+                seconds=self.coordinator.period
+            )
+
+        async with make_session() as session:
+            coins = await get_coins(session, self._shard, stale_before)
+
+        coins_info = await self._fetcher.fetch_coins_info(coins)
+        cache = self._fetcher.cache
+        logger.info("Price cache: %d hits, %d misses", cache.hits, cache.misses)
+
+        prices: dict[str, float] = {}
+        for coin in coins:
+            if (coin_info := coins_info.get(coin.token_address)) is None:
+                logger.warning("No price for %s/%s", coin.chain_id, coin.token_address)
+                continue
+            prices[coin.token_address] = coin_info.price_usd
+
+        await on_prices(coins, prices)
+
+
+class AdaptivePollingPriceSource(PriceSource):
+    def __init__(self, fetcher: PriceFetcher, shard: Shard | None = None):
+        self._fetcher = fetcher
+        self._shard = shard
+        self._coins: dict[int, Coin] = {}
+        # Heap entries go stale when a coin is rescheduled, _due holds the live one
+        self._queue: list[tuple[float, int]] = []
+        self._due: dict[int, float] = {}
+        self._polled_at: dict[int, float] = {}
+        self._prices: dict[int, float] = {}
+        self._volatility: dict[int, float] = {}
+        self._task: asyncio.Task | None = None
+
+    async def start(self, on_prices: PricesHandler):
+        self._task = asyncio.create_task(self._run(on_prices))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, on_prices: PricesHandler):
+        refreshed_at = -float("inf")
+        while True:
+            now = time.monotonic()
+            if now - refreshed_at >= POLL_REFRESH_COINS:
+                refreshed_at = now
+                try:
+                    await self._refresh_coins()
+                except Exception:
+                    logger.exception("Failed to refresh coins")
+
+            due_coins = self._pop_due(now)
+            if not due_coins:
+                next_due = self._queue[0][0] if self._queue else float("inf")
+                wait = min(next_due, refreshed_at + POLL_REFRESH_COINS) - now
+                await asyncio.sleep(max(wait, 0))
+                continue
+
+            try:
+                await self._poll(due_coins, on_prices)
+            except Exception:
+                logger.exception("Failed to poll %d coins", len(due_coins))
+                for coin in due_coins:
+                    self._schedule(coin.id, time.monotonic() + POLL_MIN_INTERVAL)
+
+    async def _refresh_coins(self):
+        async with make_session() as session:
+            coins = await get_coins(session, self._shard)
+
+        now = time.monotonic()
+        self._coins = {coin.id: coin for coin in coins}
+        for coin_id in list(self._due):
+            if coin_id not in self._coins:
+                del self._due[coin_id]
+                self._polled_at.pop(coin_id, None)
+                self._prices.pop(coin_id, None)
+                self._volatility.pop(coin_id, None)
+
+        for coin_id in self._coins:
+            if coin_id not in self._polled_at:
+                self._schedule(coin_id, now)
+            else:
+                # Subscriptions may have changed, so may the distance to alerts
+                due = self._polled_at[coin_id] + self._interval(coin_id)
+                if due < self._due[coin_id]:
+                    self._schedule(coin_id, due)
+
+    def _pop_due(self, now: float):
+        due_coins: list[Coin] = []
+        while self._queue and len(due_coins) < POLL_BATCH_SIZE:
+            due, coin_id = self._queue[0]
+            if due > now:
+                break
+            heapq.heappop(self._queue)
+            if self._due.get(coin_id) == due:
+                due_coins.append(self._coins[coin_id])
+        return due_coins
+
+    async def _poll(self, coins: list[Coin], on_prices: PricesHandler):
+        # Coins near an alert are polled more often than the price cache expires
+        coins_info = await self._fetcher.fetch_coins_info(coins, fresh=True)
+
+        now = time.monotonic()
+        prices: dict[str, float] = {}
+        for coin in coins:
+            if (coin_info := coins_info.get(coin.token_address)) is not None:
+                prices[coin.token_address] = coin_info.price_usd
+                self._observe(coin.id, coin_info.price_usd)
+            self._polled_at[coin.id] = now
+        await on_prices(coins, prices)
+
+        for coin in coins:
+            self._schedule(coin.id, now + self._interval(coin.id))
+
+    def _observe(self, coin_id: int, price: float):
+        if (previous := self._prices.get(coin_id)) is not None and previous > 0:
+            change = abs(price / previous - 1)
+            volatility = self._volatility.get(coin_id, change)
+            self._volatility[coin_id] = volatility + POLL_VOLATILITY_SMOOTHING * (
+                change - volatility
+            )
+        self._prices[coin_id] = price
+
+    def _interval(self, coin_id: int):
+        price = self._prices.get(coin_id)
+        if price is None:
+            return POLL_MIN_INTERVAL
+        distance = alert_index.distance(coin_id, price)
+        if distance is None:
+            return POLL_MAX_INTERVAL
+
+        volatility = max(self._volatility.get(coin_id, 0), POLL_VOLATILITY_FLOOR)
+        interval = POLL_MIN_INTERVAL * distance / volatility
+        return min(max(interval, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL)
+
+    def _schedule(self, coin_id: int, due: float):
+        self._due[coin_id] = due
+        heapq.heappush(self._queue, (due, coin_id))
+
+
+# The feed takes {"type": "subscribe", "pairs": [{"chainId", "pairAddress"}]}
+# and pushes ticks shaped like DexScreener's {"pairs": [...]} responses
+class StreamingPriceSource(PriceSource):
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str = PRICE_STREAM_URL,
+        shard: Shard | None = None,
+    ):
+        self._session = session
+        self._url = url
+        self._shard = shard
+        # By lowercased address, EVM pairs may come back in a different case
+        self._coins: dict[str, Coin] = {}
+        self._ticks: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+    async def start(self, on_prices: PricesHandler):
+        self._task = asyncio.create_task(self._run(on_prices))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, on_prices: PricesHandler):
+        flusher = asyncio.create_task(self._flush(on_prices))
+        try:
+            while True:
+                try:
+                    async with self._session.ws_connect(self._url) as ws:
+                        logger.info("Connected to price stream %s", self._url)
+                        self._coins.clear()
+                        self._ticks.clear()
+                        await self._receive(ws)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    logger.exception("Price stream connection failed")
+                except Exception:
+                    logger.exception("Price stream failed, reconnecting")
+                await asyncio.sleep(PRICE_STREAM_RECONNECT_DELAY)
+        finally:
+            flusher.cancel()
+
+    async def _receive(self, ws: aiohttp.ClientWebSocketResponse):
+        subscriber = asyncio.create_task(self._subscribe(ws))
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    pairs = TokenStatusResponse.from_json(message.data).pairs
+                except ValueError as e:
+                    # Includes ValidationError, one bad frame shouldn't drop the feed
+                    logger.warning("Skipped unreadable price stream message: %s", e)
+                    continue
+                for pair in pairs:
+                    if (coin := self._coins.get(pair.pair_address.lower())) is not None:
+                        self._ticks[coin.token_address] = pair.price_usd
+        finally:
+            subscriber.cancel()
+
+    async def _subscribe(self, ws: aiohttp.ClientWebSocketResponse):
+        # New coins appear as users subscribe, pick them up periodically
+        while True:
+            try:
+                async with make_session() as session:
+                    coins = await get_coins(session, self._shard)
+
+                new_coins = [
+                    coin
+                    for coin in coins
+                    if coin.token_address.lower() not in self._coins
+                ]
+                if new_coins:
+                    await ws.send_str(
+                        json.dumps(
+                            {
+                                "type": "subscribe",
+                                "pairs": [
+                                    {
+                                        "chainId": coin.chain_id,
+                                        "pairAddress": coin.token_address,
+                                    }
+                                    for coin in new_coins
+                                ],
+                            }
+                        )
+                    )
+                    self._coins.update(
+                        (coin.token_address.lower(), coin) for coin in new_coins
+                    )
+            except Exception:
+                logger.exception("Failed to subscribe to new coins")
+            await asyncio.sleep(PRICE_STREAM_RESUBSCRIBE)
+
+    async def _flush(self, on_prices: PricesHandler):
+        # Only the latest tick per pair within the debounce window is evaluated
+        while True:
+            await asyncio.sleep(PRICE_STREAM_DEBOUNCE)
+            if not self._ticks:
+                continue
+
+            ticks, self._ticks = self._ticks, {}
+            coins = [self._coins[token_address.lower()] for token_address in ticks]
+            try:
+                await on_prices(coins, ticks)
+            except Exception:
+                logger.exception("Failed to process streamed prices")
+
+
+def create_price_source(
+    fetcher: PriceFetcher,
+    scheduler: AsyncIOScheduler,
+    shard: Shard | None = None,
+) -> PriceSource:
+    match PRICE_SOURCE:
+        case "polling":
+            return PollingPriceSource(fetcher, scheduler, shard)
+        case "adaptive":
+            return AdaptivePollingPriceSource(fetcher, shard)
+        case "stream":
+            return StreamingPriceSource(fetcher.session, shard=shard)
+        case _:
+            raise ValueError(f"Unknown price source: {PRICE_SOURCE}")
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+from cachetools import LRUCache
+from sqlalchemy import delete, insert, select
+
+from src.config import (
+    FSM_CACHE_SIZE,
+    FSM_EVICT_EVERY,
+    FSM_FLUSH_INTERVAL,
+    FSM_STORAGE,
+    FSM_TTL,
+)
+from src.constants import SQLITE_MAX_VARIABLES
+from src.database import make_session
+from src.models import FsmRecord
+from src.utils import chunked
+
+logger = logging.getLogger(__name__)
+
+# Version 1 was marshal, whose format may change between Python versions
+FORMAT_VERSION = 2
+# Keys aiogram_dialog and our dialogs write on every step, stored as their
+# index. Only append to this tuple, stored records refer to the positions.
+KEYS = (
+    "_intent_id",
+    "_stack_id",
+    "state",
+    "start_data",
+    "dialog_data",
+    "widget_data",
+    "access_settings",
+    "user_ids",
+    "custom",
+    "_id",
+    "intents",
+    "last_message_id",
+    "last_reply_keyboard",
+    "last_media_id",
+    "last_media_unique_id",
+    "last_income_media_group_id",
+    "blockchain",
+    "token_address",
+    "alert_kind",
+    "alert_window",
+    "coin_id",
+    "token_name",
+)
+KEY_CODES = {key: str(code) for code, key in enumerate(KEYS)}
+UNKNOWN_KEY_PREFIX = "$"
+
+
+# Data must be JSON-like, as with aiogram's RedisStorage. Known keys are
+# written as their index, others with a prefix so the two can't collide.
+def _pack(value: Any) -> Any:
+    if isinstance(value, dict):
+        packed: dict[str, Any] = {}
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError(f"FSM data keys must be str, got {key!r}")
+            packed[KEY_CODES.get(key) or UNKNOWN_KEY_PREFIX + key] = _pack(item)
+        return packed
+    if isinstance(value, (list, tuple)):
+        return [_pack(item) for item in value]
+    return value
+
+
+def _unpack(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            (
+                key.removeprefix(UNKNOWN_KEY_PREFIX)
+                if key.startswith(UNKNOWN_KEY_PREFIX)
+                else KEYS[int(key)]
+            ): _unpack(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_unpack(item) for item in value]
+    return value
+
+
+def encode_data(data: Mapping[str, Any]) -> bytes:
+    return (
+        bytes((FORMAT_VERSION,))
+        + json.dumps(_pack(dict(data)), separators=(",", ":")).encode()
+    )
+
+
+def decode_data(value: bytes) -> dict[str, Any]:
+    if value[0] != FORMAT_VERSION:
+        raise ValueError(f"Unknown FSM record format {value[0]}")
+    return _unpack(json.loads(value[1:]))
+
+
+# FSM storage on the bot's SQLite database. Writes land in memory and are
+# flushed in batches every flush_interval seconds; reads go through an LRU of
+# encoded records. Records untouched for ttl seconds are evicted.
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        key_builder: KeyBuilder | None = None,
+        ttl: float = FSM_TTL,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        cache_size: int = FSM_CACHE_SIZE,
+    ):
+        self._key_builder = key_builder or DefaultKeyBuilder(
+            with_bot_id=True, with_destiny=True
+        )
+        self._ttl = ttl
+        self._flush_interval = flush_interval
+        # key -> (value, expires_at), a None value marks a missing record
+        self._cache: LRUCache[str, tuple[bytes | None, float]] = LRUCache(cache_size)
+        self._dirty: dict[str, tuple[bytes | None, float]] = {}
+        self._flushing: dict[str, tuple[bytes | None, float]] = {}
+        self._flusher: asyncio.Task | None = None
+        self._evicted_at = 0.0
+
+    async def _get(self, key: str):
+        entry = self._dirty.get(key) or self._flushing.get(key) or self._cache.get(key)
+        if entry is None:
+            async with make_session() as session:
+                row = (
+                    await session.execute(
+                        select(FsmRecord.value, FsmRecord.expires_at).where(
+                            FsmRecord.key == key
+                        )
+                    )
+                ).first()
+            # A write during the read is newer than the row
+            entry = (
+                self._dirty.get(key)
+                or self._flushing.get(key)
+                or self._cache.get(key)
+                or ((None, math.inf) if row is None else tuple(row))
+            )
+            self._cache[key] = entry
+
+        value, expires_at = entry
+        return value if expires_at > time.time() else None
+
+    def _set(self, key: str, value: bytes | None):
+        entry = (value, time.time() + self._ttl if value else math.inf)
+        self._dirty[key] = entry
+        self._cache[key] = entry
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def set_state(self, key: StorageKey, state: StateType = None):
+        if isinstance(state, State):
+            state = state.state
+        self._set(
+            self._key_builder.build(key, "state"),
+            state.encode() if state else None,
+        )
+
+    async def get_state(self, key: StorageKey):
+        value = await self._get(self._key_builder.build(key, "state"))
+        return value.decode() if value else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]):
+        self._set(
+            self._key_builder.build(key, "data"),
+            encode_data(data) if data else None,
+        )
+
+    async def get_data(self, key: StorageKey):
+        value = await self._get(self._key_builder.build(key, "data"))
+        if not value:
+            return {}
+        try:
+            return decode_data(value)
+        except ValueError:
+            logger.warning("Dropped unreadable FSM record %s", key)
+            return {}
+
+    async def flush(self):
+        if not self._dirty:
+            return
+
+        self._flushing, self._dirty = self._dirty, {}
+        upserts = [
+            {"key": key, "value": value, "expires_at": int(expires_at)}
+            for key, (value, expires_at) in self._flushing.items()
+            if value
+        ]
+        deletes = [key for key, (value, _) in self._flushing.items() if not value]
+        try:
+            async with make_session() as session:
+                if upserts:
+                    await session.execute(
+                        insert(FsmRecord).prefix_with("OR REPLACE"), upserts
+                    )
+                for chunk in chunked(deletes, SQLITE_MAX_VARIABLES):
+                    await session.execute(
+                        delete(FsmRecord).where(FsmRecord.key.in_(chunk))
+                    )
+                await session.commit()
+        except BaseException:
+            # Keep the records for the next flush unless they were rewritten
+            self._dirty = self._flushing | self._dirty
+            raise
+        finally:
+            self._flushing = {}
+
+    async def evict_expired(self):
+        async with make_session() as session:
+            result = await session.execute(
+                delete(FsmRecord).where(FsmRecord.expires_at <= int(time.time()))
+            )
+            await session.commit()
+        self._evicted_at = time.monotonic()
+        if result.rowcount:
+            logger.info("Evicted %d idle FSM records", result.rowcount)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._evicted_at >= FSM_EVICT_EVERY:
+                    await self.evict_expired()
+            except Exception:
+                logger.exception("Failed to flush FSM records")
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+
+def create_fsm_storage() -> BaseStorage:
+    match FSM_STORAGE:
+        case "sqlite":
+            return SQLiteStorage()
+        case "memory":
+            return MemoryStorage()
+        case _:
+            raise ValueError(f"Unknown FSM storage: {FSM_STORAGE}")
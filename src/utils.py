@@ -1,9 +1,20 @@
+import atexit
+import copy
+import json
 import logging
+import logging.config
+import queue
+import random
 import secrets
-from typing import Optional, TypeVar
+import time
+import zlib
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterable, Iterator, NamedTuple, Optional, TypeVar
 
 import aiohttp
 from tenacity import (
+    RetryCallState,
     after_log,
     before_sleep_log,
     retry,
@@ -12,9 +23,18 @@ from tenacity import (
     wait_fixed,
 )
 
-from src.config import LOGGING_LEVEL
+from src.breaker import CircuitOpenError, retry_budget
+from src.config import (
+    ALERT_WINDOWS,
+    LOGGING_CONFIG,
+    LOGGING_LEVEL,
+    RETRY_ATTEMPTS,
+    TRACE_SAMPLE_RATE,
+)
+from src.metrics import RATE_LIMITED, RETRIES
 
 logger = logging.getLogger()
+trace_logger = logging.getLogger("trace")
 
 T = TypeVar("T")
 
@@ -24,39 +44,126 @@ def cast_away_optional(arg: Optional[T]) -> T:
     return arg
 
 
+def chunked(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def join_lines(lines: Iterable[str], limit: int) -> Iterator[str]:
+    # Joins lines into texts of at most limit characters, longer lines are cut
+    text = ""
+    for line in lines:
+        line = line[:limit]
+        if text and len(text) + 1 + len(line) > limit:
+            yield text
+            text = ""
+        text = f"{text}\n{line}" if text else line
+    if text:
+        yield text
+
+
+log_retry = before_sleep_log(logger, LOGGING_LEVEL)
+
+
+def before_retry_sleep(retry_state: RetryCallState):
+    log_retry(retry_state)
+    RETRIES.inc(getattr(retry_state.fn, "__name__", "unknown"))
+    exception = retry_state.outcome.exception() if retry_state.outcome else None
+    if isinstance(exception, aiohttp.ClientResponseError) and exception.status == 429:
+        RATE_LIMITED.inc("dexscreener")
+
+
+def should_retry(retry_state: RetryCallState):
+    exception = retry_state.outcome.exception() if retry_state.outcome else None
+    return (
+        exception is not None
+        and not isinstance(exception, CircuitOpenError)
+        # The last attempt mustn't spend the budget
+        and retry_state.attempt_number < RETRY_ATTEMPTS
+        and retry_budget.acquire()
+    )
+
+
 custom_retry = retry(
-    stop=stop_after_attempt(5),
+    retry=should_retry,
+    stop=stop_after_attempt(RETRY_ATTEMPTS),
     wait=wait_exponential(),
-    before_sleep=before_sleep_log(logger, LOGGING_LEVEL),
+    before_sleep=before_retry_sleep,
     reraise=True,
 )
 
 
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    def owns(self, key: str):
+        # crc32 is stable across processes, unlike hash() with PYTHONHASHSEED
+        return zlib.crc32(key.encode()) % self.count == self.index
+
+
+def format_window(seconds: int):
+    for label, window in ALERT_WINDOWS.items():
+        if window == seconds:
+            return label
+    return f"{seconds // 60}m"
+
+
 def generate_id():
     return secrets.token_hex(2)
 
 
 async def trace_request_start(session, trace_config_ctx, params):
-    request_id = generate_id()
-    trace_config_ctx.request_id = request_id
-    logger.info(
-        f"Request [{request_id}]: {params.method} {params.url} {params.headers}"
+    # Only a sample of requests is traced, the rest skip all formatting
+    trace_config_ctx.sampled = random.random() < TRACE_SAMPLE_RATE and (
+        trace_logger.isEnabledFor(logging.INFO)
+    )
+    if not trace_config_ctx.sampled:
+        return
+    trace_config_ctx.request_id = generate_id()
+    trace_config_ctx.started_at = time.perf_counter()
+    trace_logger.info(
+        "Request %s %s",
+        params.method,
+        params.url,
+        extra={"request_id": trace_config_ctx.request_id, "method": params.method},
     )
 
 
 async def trace_request_chunk_sent(session, trace_config_ctx, params):
-    request_id = trace_config_ctx.request_id
-    if params.chunk:
-        payload = f"Payload: {params.chunk.decode() if isinstance(params.chunk, bytes) else params.chunk}"
-    else:
-        payload = "Payload: None"
-    logger.info(f"Sent [{request_id}]: {payload}")
+    if trace_config_ctx.sampled and trace_logger.isEnabledFor(logging.DEBUG):
+        trace_logger.debug(
+            "Sent %d bytes",
+            len(params.chunk),
+            extra={"request_id": trace_config_ctx.request_id},
+        )
 
 
 async def trace_request_end(session, trace_config_ctx, params):
-    request_id = trace_config_ctx.request_id
-    # body = await params.response.clone().json()
-    logger.info(f"Response [{request_id}]: {params.response.status}")
+    if not trace_config_ctx.sampled:
+        return
+    elapsed = time.perf_counter() - trace_config_ctx.started_at
+    trace_logger.info(
+        "Response %s in %.3fs",
+        params.response.status,
+        elapsed,
+        extra={
+            "request_id": trace_config_ctx.request_id,
+            "status": params.response.status,
+            "elapsed": elapsed,
+        },
+    )
+
+
+async def trace_request_exception(session, trace_config_ctx, params):
+    if not trace_config_ctx.sampled:
+        return
+    trace_logger.warning(
+        "Request failed: %r",
+        params.exception,
+        extra={"request_id": trace_config_ctx.request_id},
+    )
 
 
 def get_aiohttp_trace_config():
@@ -64,4 +171,59 @@ def get_aiohttp_trace_config():
     trace_config.on_request_start.append(trace_request_start)
     trace_config.on_request_chunk_sent.append(trace_request_chunk_sent)
     trace_config.on_request_end.append(trace_request_end)
+    trace_config.on_request_exception.append(trace_request_exception)
     return trace_config
+
+
+# Attributes every LogRecord has, anything else was passed in extra=
+LOG_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {
+    "message",
+    "asctime",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in LOG_RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# QueueHandler formats the whole record before queueing it and drops
+# exc_info, so tracebacks would end up in the message. The listener runs in
+# this process, only the message is resolved here and handlers format the rest.
+class LocalQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def configure_logging(config: dict = LOGGING_CONFIG):
+    # The configured handlers run on a listener thread, logging calls only
+    # resolve the message and put the record on a queue, they never wait for
+    # the file or stdout
+    logging.config.dictConfig(config)
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    root.addHandler(LocalQueueHandler(records))
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
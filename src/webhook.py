@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import secrets
+import signal
+from collections import deque
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic_core import from_json
+
+from src.config import (
+    WEBHOOK_DEDUP_SIZE,
+    WEBHOOK_DRAIN_TIMEOUT,
+    WEBHOOK_ENQUEUE_TIMEOUT,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS,
+)
+from src.metrics import (
+    UPDATE_HANDLING_SECONDS,
+    UPDATE_QUEUE_SIZE,
+    WEBHOOK_UPDATES,
+    registry,
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# Receives Telegram updates over HTTP and hands them to the dispatcher from a
+# bounded queue. A request is answered once its update is queued, so a full
+# queue slows Telegram down instead of piling up handler tasks.
+class WebhookServer:
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        host: str = WEBHOOK_HOST,
+        port: int = WEBHOOK_PORT,
+        path: str = WEBHOOK_PATH,
+        secret: str = WEBHOOK_SECRET,
+        workers: int = WEBHOOK_WORKERS,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+    ):
+        if not secret:
+            raise ValueError("The webhook needs a secret token")
+        self._dispatcher = dispatcher
+        self._bot = bot
+        self._host = host
+        self._port = port
+        self._path = path
+        self._secret = secret
+        self._workers_count = workers
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(queue_size)
+        self._workers: list[asyncio.Task] = []
+        self._seen: set[int] = set()
+        self._seen_order: deque[int] = deque()
+        self._runner: web.AppRunner | None = None
+        self._workflow_data: dict[str, Any] = {}
+        registry.on_collect(self._collect_metrics)
+
+    def _collect_metrics(self):
+        UPDATE_QUEUE_SIZE.set(self._queue.qsize())
+
+    async def __aenter__(self):
+        # The same data start_polling passes to startup hooks and handlers
+        self._workflow_data = {
+            "dispatcher": self._dispatcher,
+            "bots": [self._bot],
+            **self._dispatcher.workflow_data,
+        }
+        await self._dispatcher.emit_startup(bot=self._bot, **self._workflow_data)
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self._workers_count)
+        ]
+        app = web.Application()
+        app.router.add_post(self._path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        logger.info(
+            "Serving webhook on http://%s:%s%s with %d workers",
+            self._host,
+            self._port,
+            self._path,
+            self._workers_count,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        # Queued updates were already acknowledged to Telegram
+        try:
+            await asyncio.wait_for(self._queue.join(), WEBHOOK_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Dropped %d queued updates", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        try:
+            await self._dispatcher.emit_shutdown(bot=self._bot, **self._workflow_data)
+        finally:
+            await self._bot.session.close()
+
+    async def join(self):
+        await self._queue.join()
+
+    def _remember(self, update_id: int):
+        self._seen.add(update_id)
+        self._seen_order.append(update_id)
+        if len(self._seen_order) > WEBHOOK_DEDUP_SIZE:
+            self._seen.discard(self._seen_order.popleft())
+
+    def _forget(self, update_id: int):
+        self._seen.discard(update_id)
+        try:
+            self._seen_order.remove(update_id)
+        except ValueError:
+            # Already pushed out of the window by newer updates
+            pass
+
+    async def _handle(self, request: web.Request):
+        if not secrets.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), self._secret
+        ):
+            return web.Response(status=401)
+        try:
+            update = from_json(await request.read())
+            update_id = update["update_id"]
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+
+        # Telegram redelivers updates it got no timely 200 for
+        if update_id in self._seen:
+            WEBHOOK_UPDATES.inc("duplicate")
+            return web.Response()
+        self._remember(update_id)
+        try:
+            await asyncio.wait_for(self._queue.put(update), WEBHOOK_ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Telegram retries it, the redelivery must not count as a duplicate
+            self._forget(update_id)
+            WEBHOOK_UPDATES.inc("rejected")
+            return web.Response(status=503)
+        WEBHOOK_UPDATES.inc("accepted")
+        return web.Response()
+
+    async def _work(self):
+        while True:
+            data = await self._queue.get()
+            try:
+                update = Update.model_validate(data, context={"bot": self._bot})
+                with UPDATE_HANDLING_SECONDS.time():
+                    await self._dispatcher.feed_update(
+                        self._bot, update, **self._workflow_data
+                    )
+            except Exception:
+                logger.exception("Failed to handle update %s", data.get("update_id"))
+            finally:
+                self._queue.task_done()
+
+
+async def wait_for_stop_signal():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
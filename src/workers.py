@@ -0,0 +1,114 @@
+import asyncio
+import copy
+import logging
+import multiprocessing
+import time
+from contextlib import AsyncExitStack
+from multiprocessing.queues import Queue
+from typing import Sequence
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from src.config import (
+    LOGGING_CONFIG,
+    METRICS_HOST,
+    METRICS_PORT,
+    WORKER_ALERT_INDEX_REFRESH,
+)
+from src.database import make_session
+from src.fetcher import PriceFetcher
+from src.metrics import MetricsServer
+from src.models import Coin
+from src.notifier import Notifier
+from src.service import load_alert_index, update_prices_and_notify_subscribers
+from src.sources import create_price_source
+from src.utils import Shard, configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueNotifier:
+    def __init__(self, queue: Queue):
+        self._queue = queue
+
+    async def send(self, chat_id: int, text: str):
+        self._queue.put((chat_id, text))
+
+
+class WorkerPool:
+    def __init__(self, dispatcher: Notifier, workers: int):
+        self._dispatcher = dispatcher
+        self._context = multiprocessing.get_context("spawn")
+        self._queue: Queue = self._context.Queue()
+        self._processes = [
+            self._context.Process(
+                target=run_worker,
+                args=(Shard(i, workers), self._queue),
+                name=f"price-worker-{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        self._drainer: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        for process in self._processes:
+            process.start()
+        self._drainer = asyncio.create_task(self._drain())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        # Wake up the executor thread blocked on the queue
+        self._queue.put(None)
+        if self._drainer is not None:
+            await asyncio.gather(self._drainer, return_exceptions=True)
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while (item := await loop.run_in_executor(None, self._queue.get)) is not None:
+            chat_id, text = item
+            await self._dispatcher.send(chat_id, text)
+
+
+def run_worker(shard: Shard, queue: Queue):
+    logging_config = copy.deepcopy(LOGGING_CONFIG)
+    logging_config["handlers"]["file_handler"][
+        "filename"
+    ] = f"logs/worker-{shard.index}.log"
+    configure_logging(logging_config)
+
+    try:
+        asyncio.run(_run_worker(shard, queue))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _run_worker(shard: Shard, queue: Queue):
+    logger.info("Price worker %d/%d started", shard.index + 1, shard.count)
+    notifier = QueueNotifier(queue)
+    scheduler = AsyncIOScheduler()
+    loaded_at = -float("inf")
+
+    async def on_prices(coins: Sequence[Coin], prices: dict[str, float]):
+        nonlocal loaded_at
+        # Subscriptions change in the bot process, so reload them periodically
+        if time.monotonic() - loaded_at >= WORKER_ALERT_INDEX_REFRESH:
+            async with make_session() as session:
+                await load_alert_index(session, shard)
+            loaded_at = time.monotonic()
+        await update_prices_and_notify_subscribers(coins, prices, notifier)
+
+    async with AsyncExitStack() as stack:
+        if METRICS_PORT:
+            await stack.enter_async_context(
+                MetricsServer(METRICS_HOST, METRICS_PORT + 1 + shard.index)
+            )
+        fetcher = await stack.enter_async_context(PriceFetcher())
+        price_source = create_price_source(fetcher, scheduler, shard)
+        await price_source.start(on_prices)
+        scheduler.start()
+        await asyncio.Event().wait()
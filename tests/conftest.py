@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:test")
+# A local DexScreener stub serves these, failed calls aren't retried
+os.environ["DEXSCREENER_API_URL"] = "http://127.0.0.1:8944"
+os.environ["RETRY_BUDGET"] = "0"
+os.environ["DATABASE_URI"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
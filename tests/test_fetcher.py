@@ -0,0 +1,81 @@
+import asyncio
+from collections import Counter
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from src.constants import BASE_API_URL
+from src.fetcher import PriceFetcher
+from src.models import Coin
+
+REQUESTS = web.AppKey("requests", list)
+
+
+async def pairs(request: web.Request):
+    chain_id = request.match_info["chain_id"]
+    pair_addresses = request.match_info["pair_ids"].split(",")
+    request.app[REQUESTS].append((chain_id, len(pair_addresses)))
+    match chain_id:
+        case "broken":
+            raise web.HTTPInternalServerError()
+        case "empty":
+            return web.json_response({"schemaVersion": "1.0.0", "pairs": None})
+    return web.json_response(
+        {
+            "schemaVersion": "1.0.0",
+            "pairs": [
+                {
+                    "chainId": chain_id,
+                    "dexId": "stonfi",
+                    "url": "https://dexscreener.com",
+                    # EVM addresses come back checksummed or lowercased
+                    "pairAddress": address.lower(),
+                    "baseToken": {"address": "base", "name": "Token", "symbol": "T"},
+                    "priceUsd": str(len(address)),
+                }
+                for address in pair_addresses
+                if not address.startswith("missing")
+            ],
+        }
+    )
+
+
+async def fetch(coins: list[Coin]):
+    app = web.Application()
+    app[REQUESTS] = []
+    app.router.add_get("/latest/dex/pairs/{chain_id}/{pair_ids}", pairs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", urlsplit(BASE_API_URL).port).start()
+    try:
+        async with PriceFetcher() as fetcher:
+            return await fetcher.fetch_coins_info(coins), app[REQUESTS]
+    finally:
+        await runner.cleanup()
+
+
+def test_fetch_coins_info():
+    ton = [f"ton{i}" for i in range(65)] + ["missing"]
+    eth = ["0xAbCdEf01", "0x1234aBcD"]
+    coins = [
+        Coin(chain_id=chain_id, token_address=address)
+        for chain_id, addresses in (
+            ("ton", ton),
+            ("ethereum", eth),
+            ("empty", ["e1", "e2"]),
+            ("broken", ["b1", "b2"]),
+        )
+        for address in addresses
+    ]
+
+    coins_info, requests = asyncio.run(fetch(coins))
+
+    # Up to 30 pairs per request and chain, a failed chunk is requested once
+    assert Counter(requests) == Counter(
+        [("ton", 30), ("ton", 30), ("ton", 6)]
+        + [("ethereum", 2), ("empty", 2), ("broken", 2)]
+    )
+    # Pairs map back to the requested addresses, whatever their case
+    assert set(coins_info) == set(ton[:-1]) | set(eth)
+    assert coins_info["0xAbCdEf01"].price_usd == 10
+    assert coins_info["ton42"].pair_address == "ton42"
@@ -0,0 +1,107 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from src.notifier import NotificationDispatcher
+
+
+class FakeBot:
+    def __init__(self, latency: float = 0.0, retry_after: int = 0):
+        self.latency = latency
+        self.retry_after = retry_after
+        self.sent: list[tuple[float, int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(random.uniform(0, self.latency))
+        if self.retry_after:
+            retry_after, self.retry_after = self.retry_after, 0
+            raise TelegramRetryAfter(
+                SendMessage(chat_id=chat_id, text=text),
+                "Too Many Requests",
+                retry_after,
+            )
+        self.sent.append((time.monotonic(), chat_id, text))
+
+
+async def deliver(bot: FakeBot, messages: list[tuple[int, str]], **kwargs):
+    kwargs.setdefault("rate_limit", 1000)
+    kwargs.setdefault("chat_interval", 0)
+    async with NotificationDispatcher(bot, **kwargs) as dispatcher:
+        for chat_id, text in messages:
+            await dispatcher.send(chat_id, text)
+        await dispatcher.join()
+    return dispatcher
+
+
+def test_keeps_order_per_chat():
+    bot = FakeBot(latency=0.005)
+    messages = [(chat_id, str(i)) for i in range(20) for chat_id in range(5)]
+    asyncio.run(deliver(bot, messages, workers=8))
+
+    texts = defaultdict(list)
+    for _, chat_id, text in bot.sent:
+        texts[chat_id].append(text)
+    assert texts == {chat_id: [str(i) for i in range(20)] for chat_id in range(5)}
+
+
+def test_caps_global_rate():
+    bot = FakeBot()
+    rate = 100
+    asyncio.run(
+        deliver(bot, [(chat_id, "hi") for chat_id in range(51)], rate_limit=rate)
+    )
+
+    times = [sent_at for sent_at, _, _ in bot.sent]
+    assert len(times) == 51
+    # The bucket holds one token, so no burst goes past the rate
+    for k in (10, 50):
+        for i in range(len(times) - k):
+            assert times[i + k] - times[i] >= k / rate * 0.95
+
+
+def test_spaces_messages_to_one_chat():
+    bot = FakeBot()
+    asyncio.run(deliver(bot, [(1, "a"), (1, "b"), (2, "c")], chat_interval=0.2))
+
+    sent_at = {text: at for at, _, text in bot.sent}
+    assert sent_at["b"] - sent_at["a"] >= 0.2 * 0.95
+    assert sent_at["c"] - sent_at["a"] < 0.1
+
+
+def test_pauses_all_chats_on_retry_after():
+    bot = FakeBot(retry_after=1)
+    start = time.monotonic()
+    asyncio.run(deliver(bot, [(chat_id, "hi") for chat_id in range(5)], workers=5))
+
+    assert len(bot.sent) == 5
+    assert all(sent_at - start >= 0.95 for sent_at, _, _ in bot.sent)
+
+
+def test_forgets_idle_chats():
+    async def run():
+        bot = FakeBot()
+        dispatcher = await deliver(
+            bot, [(chat_id, "hi") for chat_id in range(10)], chat_interval=0.1
+        )
+        assert dispatcher._chat_sent_at
+        await asyncio.sleep(0.2)
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+    assert not dispatcher._backlogs
+    assert not dispatcher._chat_sent_at
+
+
+def test_spacing_doesnt_hold_up_other_chats():
+    bot = FakeBot()
+    messages = [(1, str(i)) for i in range(5)] + [(2, "other")]
+    start = time.monotonic()
+    asyncio.run(deliver(bot, messages, workers=2, chat_interval=0.2))
+
+    sent_at = {text: at for at, _, text in bot.sent}
+    assert sent_at["other"] - start < 0.1
+    assert sent_at["4"] - start >= 4 * 0.2 * 0.95
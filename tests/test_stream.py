@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import sys
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from src import sources
+from src.database import create_tables, make_session
+from src.models import Coin
+from src.sources import StreamingPriceSource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts"))
+import fake_price_stream  # noqa: E402
+
+PORT = 8945
+URL = f"ws://127.0.0.1:{PORT}/ws"
+TICK_INTERVAL = 0.02
+DEBOUNCE = 0.3
+
+
+@pytest.fixture(autouse=True)
+def fast_stream(monkeypatch):
+    monkeypatch.setattr(sources, "PRICE_STREAM_DEBOUNCE", DEBOUNCE)
+    monkeypatch.setattr(sources, "PRICE_STREAM_RECONNECT_DELAY", 0.1)
+    monkeypatch.setattr(sources, "PRICE_STREAM_RESUBSCRIBE", 0.1)
+
+
+async def add_coins(*token_addresses: str):
+    await create_tables()
+    async with make_session() as session:
+        session.add_all(
+            Coin(chain_id="ton", token_address=address, token_name=address, price=1.0)
+            for address in token_addresses
+        )
+        await session.commit()
+
+
+async def serve(handler):
+    app = web.Application()
+    app[fake_price_stream.INTERVAL] = TICK_INTERVAL
+    app.router.add_get("/ws", handler)
+    runner = web.AppRunner(app, shutdown_timeout=0.1)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    return runner
+
+
+def test_subscribes_debounces_and_reconnects():
+    batches: list[tuple[list[str], dict[str, float]]] = []
+
+    async def on_prices(coins, prices):
+        batches.append(([coin.token_address for coin in coins], prices))
+
+    async def run():
+        await add_coins("stream-a", "stream-b")
+        runner = await serve(fake_price_stream.stream)
+        async with aiohttp.ClientSession() as session:
+            source = StreamingPriceSource(session, URL)
+            await source.start(on_prices)
+            await asyncio.sleep(1)
+            connected = len(batches)
+
+            # The feed drops the connection and comes back
+            await runner.cleanup()
+            await asyncio.sleep(0.5)
+            dropped = len(batches)
+            runner = await serve(fake_price_stream.stream)
+            await asyncio.sleep(1)
+            await source.stop()
+        await runner.cleanup()
+        return connected, dropped
+
+    connected, dropped = asyncio.run(run())
+
+    # Ticks arrive every 20ms, only the latest per pair is flushed each 300ms
+    assert 1 <= connected <= 1 / DEBOUNCE + 1
+    assert len(batches) > dropped
+    for coins, prices in batches:
+        assert set(coins) == set(prices) <= {"stream-a", "stream-b"}
+    assert {"stream-a", "stream-b"} <= set(batches[-1][1])
+
+
+def test_matches_pairs_case_insensitively():
+    batches: list[dict[str, float]] = []
+
+    async def on_prices(coins, prices):
+        batches.append(prices)
+
+    async def lowercase_feed(request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            for pair in json.loads(message.data)["pairs"]:
+                address = pair["pairAddress"].lower()
+                tick = {"pairAddress": address, "priceUsd": "1.5"}
+                await ws.send_str(
+                    json.dumps({"pairs": [tick | {"baseToken": {"symbol": "MC"}}]})
+                )
+        return ws
+
+    async def run():
+        await add_coins("0xMixedCase")
+        runner = await serve(lowercase_feed)
+        async with aiohttp.ClientSession() as session:
+            source = StreamingPriceSource(session, URL)
+            await source.start(on_prices)
+            await asyncio.sleep(DEBOUNCE * 2)
+            await source.stop()
+        await runner.cleanup()
+
+    asyncio.run(run())
+
+    assert any(prices.get("0xMixedCase") == 1.5 for prices in batches)